@@ -1,3 +1,239 @@
+import hashlib
+import uuid
+
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.forms import BaseUserCreationForm, UserChangeForm
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import events
+from .models import CustomUser
+from .sharding import make_user_id
+
+
+def estimate_row_count(model, using):
+    """
+    Planner statistics row count for the model's table, or None when the
+    backend keeps none (SQLite only has them after ANALYZE).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(table)],
+                )
+            elif connection.vendor == "sqlite":
+                # One row per index, and a partial index only counts its
+                # own rows: the table's size is the largest leading count
+                cursor.execute(
+                    "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s",
+                    [table],
+                )
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # -1: never analyzed
+
+
+class LargeTablePaginator(Paginator):
+    """
+    Changelist paginator for tables too big to COUNT(*) or OFFSET through.
+
+    - count: the planner's estimate for the unfiltered table once it is
+      past `estimate_threshold`; filtered lists count at most `max_count`.
+    - page(): when the list is in `keyset` order, the last key of every
+      served page is cached, so the next page is an index seek past it
+      instead of an OFFSET. Pages reached any other way (jumps, other
+      orderings) OFFSET over the primary key only, then load that page's
+      rows by pk.
+    """
+
+    estimate_threshold = 10_000
+    max_count = 100_000
+    keyset = ("-created_at", "-id")
+    boundary_timeout = 15 * 60
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return queryset[: self.max_count].count()
+
+    def page(self, number):
+        number = self.validate_number(number)
+        queryset = self.object_list
+        ordering = self._ordering(queryset)
+
+        after = None
+        if ordering == self.keyset and number > 1:
+            after = cache.get(self._boundary_key(queryset, number - 1))
+
+        if after is not None:
+            rows = list(queryset.filter(self._after(after))[: self.per_page])
+        else:
+            bottom = (number - 1) * self.per_page
+            pks = list(
+                queryset.values_list("pk", flat=True)[bottom : bottom + self.per_page]
+            )
+            position = {pk: i for i, pk in enumerate(pks)}
+            rows = sorted(queryset.filter(pk__in=pks), key=lambda obj: position[obj.pk])
+
+        if ordering == self.keyset and rows:
+            last = tuple(getattr(rows[-1], f.lstrip("-")) for f in self.keyset)
+            cache.set(
+                self._boundary_key(queryset, number), last, self.boundary_timeout
+            )
+        return Page(rows, number, self)
+
+    def _ordering(self, queryset):
+        pk = queryset.model._meta.pk.name
+        aliases = {"pk": pk, "-pk": f"-{pk}"}
+        # The changelist repeats ModelAdmin.ordering: ("-created_at", "-created_at", "-pk")
+        return tuple(dict.fromkeys(aliases.get(f, f) for f in queryset.query.order_by))
+
+    def _after(self, values):
+        """Rows strictly after `values` in keyset order"""
+        condition = Q()
+        for i, field in enumerate(self.keyset):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            term = Q(**{f"{name}__{lookup}": values[i]})
+            for prev, value in zip(self.keyset[:i], values):
+                term &= Q(**{prev.lstrip("-"): value})
+            condition |= term
+        return condition
+
+    def _boundary_key(self, queryset, number):
+        query = hashlib.blake2b(
+            str(queryset.query).encode(), digest_size=16
+        ).hexdigest()
+        return f"admin_keyset:{queryset.db}:{query}:{self.per_page}:{number}"
+
+
+class CustomUserCreationForm(BaseUserCreationForm):
+    class Meta:
+        model = CustomUser
+        fields = ("email",)
+
+
+class CustomUserChangeForm(UserChangeForm):
+    class Meta:
+        model = CustomUser
+        fields = "__all__"
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(UserAdmin):
+    """
+    Built for millions of rows: estimated counts and keyset paging (see
+    LargeTablePaginator), newest first along user_created_idx, prefix-only
+    search on the email_key unique index (or an exact id), and only the listed
+    columns fetched.
+    """
+
+    form = CustomUserChangeForm
+    add_form = CustomUserCreationForm
+    paginator = LargeTablePaginator
+
+    list_display = (
+        "email",
+        "first_name",
+        "last_name",
+        "is_verified",
+        "is_active",
+        "is_staff",
+        "created_at",
+    )
+    list_filter = ("is_verified", "is_active", "is_staff")
+    list_select_related = False  # no relations shown; never join
+    list_per_page = 50
+    list_max_show_all = 500
+    show_full_result_count = False  # would be a second COUNT(*)
+    show_facets = admin.ShowFacets.NEVER  # one COUNT per filter choice
+    search_fields = ("email",)
+    search_help_text = "Email prefix, or an exact user id"
+    ordering = ("-created_at",)
+    sortable_by = ("created_at",)  # the only indexed order
+
+    fieldsets = (
+        (None, {"fields": ("email", "password")}),
+        ("Profile", {"fields": ("first_name", "last_name", "avatar_id")}),
+        (
+            "Status",
+            {
+                "fields": (
+                    "is_verified",
+                    "is_active",
+                    "is_staff",
+                    "is_superuser",
+                    "groups",
+                    "user_permissions",
+                )
+            },
+        ),
+        ("Dates", {"fields": ("last_login", "created_at", "updated_at")}),
+    )
+    add_fieldsets = (
+        (
+            None,
+            {"classes": ("wide",), "fields": ("email", "password1", "password2")},
+        ),
+    )
+    readonly_fields = ("last_login", "created_at", "updated_at")
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith(
+            "_changelist"
+        ):
+            queryset = queryset.only(*self.list_display)
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Index range scan instead of icontains: email_key >= term AND
+        email_key < term + U+FFFF, on the lowercased email's unique index.
+        A full user id is matched exactly on the primary key.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            return queryset.filter(pk=uuid.UUID(term)), False
+        except ValueError:
+            pass
+        prefix = term.lower()
+        return (
+            queryset.filter(email_key__gte=prefix, email_key__lt=prefix + "\uffff"),
+            False,
+        )
 
-# Register your models here.
+    def save_model(self, request, obj, form, change):
+        if not change:
+            # Same shard-bucketed id as CustomUserManager.create_user
+            obj.id = make_user_id(obj.email)
+        # The change form's own transaction is on "default"; the user row and
+        # its outbox event are written to the user's shard, so commit them
+        # together there
+        using = router.db_for_write(CustomUser, instance=obj)
+        with transaction.atomic(using=using):
+            super().save_model(request, obj, form, change)
+            if not change:
+                events.publish("user.registered", obj)
+            elif "is_active" in form.changed_data and not obj.is_active:
+                events.publish("user.deactivated", obj)
@@ -0,0 +1,203 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not on Linux
+        return os.cpu_count() or 1
+
+
+DEFAULTS = {
+    # Password hashing (login, register): roughly one hash per core. With
+    # several worker processes per host, divide by the number of workers.
+    "hashing": {"CONCURRENCY": None, "QUEUE": None, "TIMEOUT": 2.0},
+    # Token refresh / logout: cheap, but must not queue behind hashing
+    "tokens": {"CONCURRENCY": 16, "QUEUE": 64, "TIMEOUT": 1.0},
+}
+
+
+def get_admission_settings():
+    configured = getattr(settings, "ADMISSION_CONTROL", {})
+    return {
+        name: {**DEFAULTS.get(name, {}), **configured.get(name, {})}
+        for name in {*DEFAULTS, *configured}
+    }
+
+
+class Overloaded(APIException):
+    """503; DRF's exception handler turns `wait` into a Retry-After header"""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Server is busy. Please retry shortly."
+    default_code = "overloaded"
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        self.wait = wait
+
+
+class AdmissionPool:
+    """
+    At most `concurrency` requests run at once; up to `queue` more wait (for
+    at most `timeout` seconds) and anything beyond that is shed straight
+    away. Counters are per process.
+    """
+
+    def __init__(self, name, concurrency, queue, timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.max_waiting = 0
+        self.avg_hold = 0.0  # EWMA of seconds a slot is held
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Returns the admission time, or None if the request was shed"""
+        with self._cond:
+            if self.active < self.concurrency and not self.waiting:
+                return self._admit()
+            if self.waiting >= self.queue:
+                self.shed_queue_full += 1
+                return None
+
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: self.active < self.concurrency, timeout=self.timeout
+                )
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.shed_timeout += 1
+                return None
+            return self._admit()
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, admitted_at):
+        held = time.monotonic() - admitted_at
+        with self._cond:
+            self.active -= 1
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held if self.avg_hold else held
+            self._cond.notify()
+
+    def retry_after(self):
+        """Seconds until the current backlog has likely drained (at least 1)"""
+        backlog = (self.active + self.waiting) * self.avg_hold / self.concurrency
+        return max(1, math.ceil(backlog))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency": self.concurrency,
+                "queue_limit": self.queue,
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "admitted": self.admitted,
+                "shed": self.shed_queue_full + self.shed_timeout,
+                "shed_queue_full": self.shed_queue_full,
+                "shed_timeout": self.shed_timeout,
+                "avg_hold_ms": round(self.avg_hold * 1000, 1),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                conf = get_admission_settings()[name]
+                concurrency = conf["CONCURRENCY"] or available_cpus()
+                queue = conf["QUEUE"] if conf["QUEUE"] is not None else 2 * concurrency
+                pool = _pools[name] = AdmissionPool(
+                    name, concurrency, queue, conf["TIMEOUT"]
+                )
+    return pool
+
+
+def admission_stats():
+    return {name: get_pool(name).stats() for name in get_admission_settings()}
+
+
+def reset_pools():
+    with _pools_lock:
+        _pools.clear()
+
+
+@receiver(setting_changed)
+def _admission_settings_changed(setting, **kwargs):
+    if setting == "ADMISSION_CONTROL":
+        reset_pools()
+
+
+@contextmanager
+def admitted(name):
+    """
+    Runs the block inside pool `name`'s capacity, or raises Overloaded (503
+    with Retry-After) when shed. Wrap only the expensive work, e.g. the
+    password hash, not slow I/O that follows it.
+    """
+    pool = get_pool(name)
+    admitted_at = pool.acquire()
+    if admitted_at is None:
+        raise Overloaded(wait=pool.retry_after())
+    try:
+        yield
+    finally:
+        pool.release(admitted_at)
+
+
+class AdmissionControlMixin:
+    """
+    For APIViews: runs the handler inside `admission_pool`'s capacity, after
+    authentication, permissions and throttling (so throttled clients never
+    take a queue slot). Over capacity: 503 with Retry-After.
+    """
+
+    admission_pool = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.admission_pool is None:
+            return
+        pool = get_pool(self.admission_pool)
+        admitted_at = pool.acquire()
+        if admitted_at is None:
+            raise Overloaded(wait=pool.retry_after())
+        self._admission = (pool, admitted_at)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._admission = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._admission is not None:
+                pool, admitted_at = self._admission
+                pool.release(admitted_at)
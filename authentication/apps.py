@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from . import faults, signals  # noqa: F401
+
+        if faults.get_fault_settings()["ENABLED"]:
+            faults.install()
@@ -0,0 +1,285 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "SINK": "jsonl",  # "jsonl" or "database"
+    "DIRECTORY": "logs/audit",
+    "SEGMENT_MAX_BYTES": 64 * 1024 * 1024,
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL": 2.0,  # seconds; None = flush when a batch fills / at exit
+    "MAX_PENDING": 10_000,
+    "BLOCK_TIMEOUT": 0.05,  # how long record() may wait on a slow sink
+}
+
+
+def get_audit_settings():
+    return {**DEFAULTS, **getattr(settings, "AUDIT_LOG", {})}
+
+
+# Sinks
+
+
+class JsonlSink:
+    """
+    Append-only JSON-lines segments: audit-<utc start>-<pid>-<seq>.jsonl.
+    Each process writes its own segment, rotated at SEGMENT_MAX_BYTES.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._file = None
+        self._size = 0
+        self._seq = 0
+
+    def write(self, events):
+        data = "".join(
+            json.dumps(e, cls=DjangoJSONEncoder, separators=(",", ":")) + "\n"
+            for e in events
+        ).encode("utf-8")
+
+        if self._file is None or (self._size and self._size + len(data) > self.max_bytes):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        started = datetime.now(dt_timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = self.directory / f"audit-{started}-{os.getpid()}-{self._seq:04d}.jsonl"
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def read(directory):
+        """Yields events from every segment, oldest segment first"""
+        for path in sorted(Path(directory).glob("audit-*.jsonl")):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    # A crash can leave a torn last line; skip it
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+
+class DatabaseSink:
+    """One bulk INSERT per batch into AuditEvent"""
+
+    def write(self, events):
+        from .models import AuditEvent
+
+        AuditEvent.objects.bulk_create(
+            [
+                AuditEvent(
+                    event=e["event"],
+                    user_id=e["user_id"],
+                    email=e["email"] or "",
+                    ip=e["ip"] or "",
+                    data=e["data"],
+                    created_at=e["ts"],
+                )
+                for e in events
+            ]
+        )
+
+    def close(self):
+        pass
+
+
+# Buffer
+
+
+class AuditLog:
+    """
+    In-memory, per-process event buffer flushed to a sink in batches.
+
+    A background thread flushes every `flush_interval` seconds or as soon
+    as a batch fills. If the sink falls behind and `max_pending` events
+    are queued, record() waits up to `block_timeout` and then drops the
+    event (counted in `dropped`) instead of stalling the request.
+    """
+
+    def __init__(self, sink, batch_size, flush_interval, max_pending, block_timeout):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.written = 0
+        self._closed = False
+        self._reset_process_state()
+
+    def _reset_process_state(self):
+        self._pid = os.getpid()
+        self._events = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, event):
+        if self._pid != os.getpid():
+            # Forked worker: the parent's buffer, thread and file aren't ours
+            self._reset_process_state()
+            self.sink.close()
+
+        with self._cond:
+            if len(self._events) >= self.max_pending and not self._cond.wait_for(
+                lambda: len(self._events) < self.max_pending,
+                timeout=self.block_timeout,
+            ):
+                self.dropped += 1
+                return False
+            self._events.append(event)
+            batch_full = len(self._events) >= self.batch_size
+            if batch_full:
+                self._cond.notify_all()
+
+        if self.flush_interval is None:
+            if batch_full:
+                self.flush()
+        elif self._thread is None:
+            self._start_flusher()
+        return True
+
+    def flush(self):
+        """Writes everything buffered so far. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._cond:
+                events, self._events = self._events, []
+                self._cond.notify_all()
+            if not events:
+                return 0
+            try:
+                self.sink.write(events)
+            except Exception:
+                logger.exception("Failed to write %d audit events", len(events))
+                self.dropped += len(events)
+                return 0
+            self.written += len(events)
+            return len(events)
+
+    def pending(self):
+        return len(self._events)
+
+    def close(self):
+        self._closed = True
+        with self._cond:
+            self._cond.notify_all()
+        self.flush()
+        self.sink.close()
+
+    def _start_flusher(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="audit-flusher", daemon=True
+            )
+        self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._events) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+            self.flush()
+
+
+_audit_log = None
+_audit_log_lock = threading.Lock()
+
+
+def get_audit_log():
+    global _audit_log
+    if _audit_log is None:
+        with _audit_log_lock:
+            if _audit_log is None:
+                conf = get_audit_settings()
+                if conf["SINK"] == "database":
+                    sink = DatabaseSink()
+                else:
+                    directory = Path(conf["DIRECTORY"])
+                    if not directory.is_absolute():
+                        directory = settings.BASE_DIR / directory
+                    sink = JsonlSink(directory, conf["SEGMENT_MAX_BYTES"])
+                _audit_log = AuditLog(
+                    sink,
+                    batch_size=conf["BATCH_SIZE"],
+                    flush_interval=conf["FLUSH_INTERVAL"],
+                    max_pending=conf["MAX_PENDING"],
+                    block_timeout=conf["BLOCK_TIMEOUT"],
+                )
+    return _audit_log
+
+
+def reset_audit_log():
+    """Flush and discard the current buffer (settings changed / shutdown)"""
+    global _audit_log
+    with _audit_log_lock:
+        log, _audit_log = _audit_log, None
+    if log is not None:
+        log.close()
+
+
+atexit.register(reset_audit_log)
+
+
+@receiver(setting_changed)
+def _audit_settings_changed(setting, **kwargs):
+    if setting == "AUDIT_LOG":
+        reset_audit_log()
+
+
+_ident = BaseThrottle()
+
+
+def record(event, request=None, user=None, email=None, user_id=None, **data):
+    """
+    Queue an audit event; never touches the database on the request path.
+    `request` may be a DRF or Django request (for IP / user agent).
+    `user_id` identifies the user when there is no user object (e.g. a
+    token's subject); `user` takes precedence.
+    """
+    if user is not None and not getattr(user, "is_authenticated", False):
+        user = None
+    if user is not None:
+        user_id = user.pk
+    if request is not None:
+        data.setdefault("user_agent", request.META.get("HTTP_USER_AGENT", "")[:200])
+
+    return get_audit_log().record(
+        {
+            "ts": timezone.now(),
+            "event": event,
+            "user_id": str(user_id) if user_id else None,
+            "email": email or (user.email if user is not None else None),
+            "ip": _ident.get_ident(request) if request is not None else None,
+            "data": data,
+        }
+    )
@@ -0,0 +1,116 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_DB = "default"
+
+# Per request/thread: have we written, and must reads stay on the primary?
+_wrote = ContextVar("db_wrote", default=False)
+_pinned = ContextVar("db_pinned", default=False)
+
+
+def get_replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """
+    Fresh routing state for one unit of work (a request, a test case).
+    Outside any scope a write pins the rest of the thread to the primary.
+    """
+    wrote_token = _wrote.set(False)
+    pinned_token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _wrote.reset(wrote_token)
+        _pinned.reset(pinned_token)
+
+
+def wrote_in_scope():
+    return _wrote.get()
+
+
+@contextmanager
+def use_primary():
+    """Force every read inside the block to the primary"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads go to a random replica from settings.DATABASE_REPLICAS, writes to
+    the primary. After a write, reads in the same request (and, via
+    ReplicaStickinessMiddleware, the same client for a short window) stay on
+    the primary so they never observe replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or _pinned.get() or _wrote.get():
+            return PRIMARY_DB
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY_DB, *get_replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes across requests: a response to a request that wrote
+    sets a signed cookie, and requests carrying it within
+    settings.REPLICA_STICKY_SECONDS read from the primary (e.g. verify right
+    after register). The pin travels with the client rather than living in
+    a per-process cache, so it holds whichever worker serves the next
+    request.
+    """
+
+    cookie_name = "db_sticky"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        pinned = (
+            request.get_signed_cookie(
+                self.cookie_name,
+                default=None,
+                salt=self.cookie_name,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+            )
+            is not None
+        )
+        with routing_scope(pinned=pinned):
+            response = self.get_response(request)
+            if wrote_in_scope():
+                response.set_signed_cookie(
+                    self.cookie_name,
+                    "1",
+                    salt=self.cookie_name,
+                    max_age=settings.REPLICA_STICKY_SECONDS,
+                    secure=request.is_secure(),
+                    httponly=True,
+                    samesite="Lax",
+                )
+
+        return response
@@ -0,0 +1,340 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .models import OutboxEvent, WebhookDelivery
+from .sharding import get_user_shards
+
+EVENTS = ("user.registered", "user.verified", "user.deactivated")
+
+DEFAULTS = {
+    # name -> {"URL", "SECRET", "EVENTS" (default all), "MAX_CONCURRENCY"}
+    "ENDPOINTS": {},
+    "BATCH_SIZE": 100,  # events per POST
+    "MAX_CONCURRENCY": 2,  # in-flight POSTs per endpoint
+    "TIMEOUT": 5.0,
+    "MAX_ATTEMPTS": 10,
+    "RETRY_BASE": 30,  # seconds; doubles per attempt, with jitter
+    "RETRY_MAX": 6 * 60 * 60,
+    "LEASE": 60,  # a claimed delivery isn't retried by another run before this
+    "FAN_OUT_BATCH": 1000,
+    # Delivered rows older than this are deleted (None keeps them); failed
+    # deliveries and their events are kept for inspection
+    "RETENTION": 7 * 24 * 60 * 60,  # seconds
+    "PURGE_INTERVAL": 60 * 60,  # seconds between purges in a --loop run
+    "PURGE_BATCH": 1000,
+}
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+
+
+def get_webhook_settings():
+    return {**DEFAULTS, **getattr(settings, "WEBHOOKS", {})}
+
+
+# Publishing
+
+
+def publish(event, user, **data):
+    """
+    Add `event` about `user` to the outbox. Call it inside the transaction
+    that makes the change, so the event exists if and only if the change
+    committed. One INSERT; nothing is sent on the request path.
+    """
+    if event not in EVENTS:
+        raise ValueError(f"Unknown event {event!r}")
+    return OutboxEvent.objects.using(user._state.db or "default").create(
+        event=event,
+        user_id=user.pk,
+        payload={
+            "id": str(uuid.uuid4()),  # receivers dedupe on this
+            "event": event,
+            "occurred_at": timezone.now().isoformat(),
+            "user": {
+                "id": str(user.pk),
+                "email": user.email,
+                "is_verified": user.is_verified,
+                "is_active": user.is_active,
+            },
+            "data": data,
+        },
+    )
+
+
+# Signatures
+
+
+def sign(secret, timestamp, body):
+    message = f"{timestamp}.".encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signature_header(secret, body, timestamp=None):
+    """X-Webhook-Signature value: t=<unix time>,v1=<HMAC-SHA256 of "t.body">"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={sign(secret, timestamp, body)}"
+
+
+def verify_signature(secret, body, header, tolerance=300):
+    """For receivers (and tests): checks the HMAC and that it is recent"""
+    try:
+        parts = dict(part.split("=", 1) for part in header.split(","))
+        timestamp = int(parts["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(parts.get("v1", ""), sign(secret, timestamp, body))
+
+
+# Dispatching
+
+
+class Dispatcher:
+    """
+    Moves outbox events to the endpoints in settings.WEBHOOKS["ENDPOINTS"].
+
+    Each run_once(), per database:
+    - fan out: new events become one pending WebhookDelivery per
+      subscribed endpoint (idempotent: unique on event + endpoint)
+    - deliver: per endpoint, up to MAX_CONCURRENCY batches of BATCH_SIZE
+      due deliveries are POSTed at once as {"events": [...]}, signed with
+      the endpoint's secret. A 2xx marks the batch delivered; anything
+      else retries it later with exponential backoff, until MAX_ATTEMPTS.
+    - purge: at most every PURGE_INTERVAL, delivered rows older than
+      RETENTION are deleted
+
+    One dispatcher covers every user shard by default; `databases` limits
+    it to some, to run one per database (manage.py dispatch_events --loop
+    --database ...). An overlapping run is safe, as each delivery is
+    leased to one run (claim).
+    """
+
+    def __init__(self, conf=None, databases=None):
+        self.conf = conf or get_webhook_settings()
+        self.databases = databases or get_user_shards() or ["default"]
+        self._purged_at = None
+        self.endpoints = {
+            name: {
+                "EVENTS": EVENTS,
+                "MAX_CONCURRENCY": self.conf["MAX_CONCURRENCY"],
+                "TIMEOUT": self.conf["TIMEOUT"],
+                **endpoint,
+            }
+            for name, endpoint in self.conf["ENDPOINTS"].items()
+        }
+
+    def run_once(self):
+        stats = Counter()
+        if not self.endpoints:
+            return stats  # leave events in the outbox for when one is added
+        purge = self.conf["RETENTION"] is not None and (
+            self._purged_at is None
+            or time.monotonic() - self._purged_at >= self.conf["PURGE_INTERVAL"]
+        )
+        for db in self.databases:
+            stats["fanned_out"] += self.fan_out(db)
+            stats.update(self.deliver(db))
+            if purge:
+                stats["purged"] += self.purge(db)
+        if purge:
+            self._purged_at = time.monotonic()
+        return stats
+
+    def fan_out(self, db):
+        total = 0
+        while True:
+            batch = list(
+                OutboxEvent.objects.using(db)
+                .filter(fanned_out=False)
+                .order_by("id")
+                .only("id", "event")[: self.conf["FAN_OUT_BATCH"]]
+            )
+            if not batch:
+                return total
+            deliveries = [
+                # event_id: the routers refuse a relation to an instance from
+                # a shard other than "default" before the delivery has a db
+                WebhookDelivery(event_id=event.id, endpoint=name)
+                for event in batch
+                for name, endpoint in self.endpoints.items()
+                if event.event in endpoint["EVENTS"]
+            ]
+            with transaction.atomic(using=db):
+                WebhookDelivery.objects.using(db).bulk_create(
+                    deliveries, ignore_conflicts=True
+                )
+                OutboxEvent.objects.using(db).filter(
+                    id__in=[event.id for event in batch]
+                ).update(fanned_out=True)
+            total += len(batch)
+
+    def deliver(self, db):
+        now = timezone.now()
+        batch_size = self.conf["BATCH_SIZE"]
+        work = []
+        for name, endpoint in self.endpoints.items():
+            limit = batch_size * endpoint["MAX_CONCURRENCY"]
+            due = self.claim(db, name, limit, now)
+            if not due:
+                continue
+            work += [
+                (endpoint, due[i : i + batch_size])
+                for i in range(0, len(due), batch_size)
+            ]
+
+        stats = Counter()
+        if not work:
+            return stats
+        # At most MAX_CONCURRENCY batches were taken per endpoint, so running
+        # them all at once respects every endpoint's limit
+        with ThreadPoolExecutor(max_workers=len(work)) as pool:
+            results = list(pool.map(lambda item: self.post(*item), work))
+
+        # Database writes stay on this thread
+        for (_, batch), error in zip(work, results):
+            stats.update(self.record(db, batch, error))
+        return stats
+
+    def claim(self, db, name, limit, now):
+        """
+        Leases up to `limit` due deliveries for endpoint `name` to this run.
+        The lease is a conditional UPDATE (still due at `now`), so when two
+        runs select the same rows each row goes to only one of them.
+        """
+        deliveries = WebhookDelivery.objects.using(db)
+        due = list(
+            deliveries.filter(
+                endpoint=name,
+                status=WebhookDelivery.PENDING,
+                next_attempt_at__lte=now,
+            )
+            .select_related("event")
+            .order_by("next_attempt_at", "id")[:limit]
+        )
+        if not due:
+            return []
+
+        ids = [d.id for d in due]
+        lease = now + timedelta(seconds=self.conf["LEASE"])
+        claimed = deliveries.filter(
+            id__in=ids, status=WebhookDelivery.PENDING, next_attempt_at__lte=now
+        ).update(next_attempt_at=lease)
+        if claimed < len(due):
+            # An overlapping run leased some first: keep only ours
+            ours = set(
+                deliveries.filter(id__in=ids, next_attempt_at=lease).values_list(
+                    "id", flat=True
+                )
+            )
+            due = [d for d in due if d.id in ours]
+        return due
+
+    def purge(self, db):
+        """
+        Deletes deliveries delivered more than RETENTION ago, then fanned-out
+        events older than that with no deliveries left, in batches.
+        Returns the number of events deleted.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.conf["RETENTION"])
+        batch_size = self.conf["PURGE_BATCH"]
+        deliveries = WebhookDelivery.objects.using(db)
+        while True:
+            ids = list(
+                deliveries.filter(
+                    status=WebhookDelivery.DELIVERED, delivered_at__lt=cutoff
+                ).values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deliveries.filter(id__in=ids).delete()
+
+        events = OutboxEvent.objects.using(db)
+        purged = 0
+        while True:
+            ids = list(
+                events.filter(fanned_out=True, created_at__lt=cutoff)
+                .exclude(Exists(deliveries.filter(event=OuterRef("pk"))))
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return purged
+            events.filter(id__in=ids).delete()
+            purged += len(ids)
+
+    def post(self, endpoint, batch):
+        """POSTs one batch; returns None on success or the error text"""
+        body = json.dumps(
+            {"events": [delivery.event.payload for delivery in batch]},
+            cls=DjangoJSONEncoder,
+            separators=(",", ":"),
+        ).encode()
+        request = urllib.request.Request(
+            endpoint["URL"],
+            data=body,
+            method="POST",
+            headers={
+                "Content-Type": "application/json",
+                SIGNATURE_HEADER: signature_header(endpoint["SECRET"], body),
+            },
+        )
+        try:
+            with urllib.request.urlopen(
+                request, timeout=endpoint["TIMEOUT"]
+            ) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            return f"HTTP {e.code}"
+        except (urllib.error.URLError, OSError) as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    def record(self, db, batch, error):
+        now = timezone.now()
+        deliveries = WebhookDelivery.objects.using(db)
+        if error is None:
+            deliveries.filter(id__in=[d.id for d in batch]).update(
+                status=WebhookDelivery.DELIVERED,
+                delivered_at=now,
+                attempts=F("attempts") + 1,
+                last_error="",
+            )
+            return Counter(delivered=len(batch))
+
+        # Usually one group: a batch's deliveries were mostly first tried together
+        by_attempts = defaultdict(list)
+        for delivery in batch:
+            by_attempts[delivery.attempts + 1].append(delivery.id)
+
+        stats = Counter()
+        for attempts, ids in by_attempts.items():
+            if attempts >= self.conf["MAX_ATTEMPTS"]:
+                deliveries.filter(id__in=ids).update(
+                    status=WebhookDelivery.FAILED, attempts=attempts, last_error=error
+                )
+                stats["failed"] += len(ids)
+                continue
+            delay = min(
+                self.conf["RETRY_MAX"], self.conf["RETRY_BASE"] * 2 ** (attempts - 1)
+            ) * random.uniform(0.8, 1.2)
+            deliveries.filter(id__in=ids).update(
+                attempts=attempts,
+                next_attempt_at=now + timedelta(seconds=delay),
+                last_error=error,
+            )
+            stats["retrying"] += len(ids)
+        return stats
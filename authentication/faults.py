@@ -0,0 +1,206 @@
+import functools
+import random
+import re
+import smtplib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.mail import get_connection
+from django.core.signals import setting_changed
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Fault injection for load/chaos testing; never enable in production.
+#
+# FAULT_INJECTION = {
+#     "ENABLED": True,
+#     "SEED": 42,
+#     "EMAIL": {"LATENCY": {"DISTRIBUTION": "fixed", "MS": 10_000}},
+#     "DB": {"ERROR_RATE": 0.05, "MATCH": r"^(INSERT|UPDATE)"},
+#     "HASHER": {"LATENCY": {"DISTRIBUTION": "lognormal", "MEDIAN_MS": 300, "SIGMA": 0.5}},
+# }
+#
+# Each target takes an optional LATENCY distribution (added before the real
+# call) and an ERROR_RATE (0..1, raised instead of the real call). DB also
+# takes MATCH, a regex the SQL must match to be affected.
+
+DEFAULTS = {"ENABLED": False, "SEED": None, "EMAIL": {}, "DB": {}, "HASHER": {}}
+
+# What each dependency raises when it really fails
+ERRORS = {
+    "EMAIL": lambda: smtplib.SMTPServerDisconnected(
+        "Connection unexpectedly closed (injected)"
+    ),
+    "DB": lambda: OperationalError("database is locked (injected)"),
+    "HASHER": lambda: MemoryError("could not allocate hashing memory (injected)"),
+}
+
+
+def get_fault_settings():
+    return {**DEFAULTS, **getattr(settings, "FAULT_INJECTION", {})}
+
+
+def sample_latency(spec, rng):
+    """Seconds to add, drawn from a LATENCY spec (or 0 without one)"""
+    if not spec:
+        return 0.0
+    distribution = spec.get("DISTRIBUTION", "fixed")
+    if distribution == "fixed":
+        ms = spec["MS"]
+    elif distribution == "uniform":
+        ms = rng.uniform(spec["MIN_MS"], spec["MAX_MS"])
+    elif distribution == "exponential":
+        ms = rng.expovariate(1 / spec["MEAN_MS"])
+    elif distribution == "lognormal":
+        # MEDIAN_MS is the typical call; SIGMA widens the tail
+        ms = spec["MEDIAN_MS"] * rng.lognormvariate(0, spec.get("SIGMA", 0.5))
+    else:
+        raise ValueError(f"Unknown latency distribution {distribution!r}")
+    return max(0.0, min(ms, spec.get("MAX_MS", ms))) / 1000
+
+
+class FaultInjector:
+    """Applies the FAULT_INJECTION settings; counts what it injected"""
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.rng = random.Random(conf["SEED"])
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._match = {
+            target: re.compile(spec["MATCH"], re.I)
+            for target, spec in conf.items()
+            if isinstance(spec, dict) and spec.get("MATCH")
+        }
+
+    def inject(self, target, detail=""):
+        spec = self.conf.get(target)
+        if not spec:
+            return
+        match = self._match.get(target)
+        if match is not None and not match.search(detail):
+            return
+
+        with self._lock:
+            delay = sample_latency(spec.get("LATENCY"), self.rng)
+            fail = self.rng.random() < spec.get("ERROR_RATE", 0)
+            self.stats[f"{target.lower()}_calls"] += 1
+            if delay:
+                self.stats[f"{target.lower()}_delayed"] += 1
+            if fail:
+                self.stats[f"{target.lower()}_errors"] += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ERRORS[target]()
+
+
+_injector = None
+_injector_lock = threading.Lock()
+
+
+def get_injector():
+    """The active injector, or None while fault injection is disabled"""
+    global _injector
+    if _injector is None:
+        conf = get_fault_settings()
+        if not conf["ENABLED"]:
+            return None
+        with _injector_lock:
+            if _injector is None:
+                _injector = FaultInjector(conf)
+    return _injector
+
+
+@receiver(setting_changed)
+def _fault_settings_changed(setting, **kwargs):
+    global _injector
+    if setting == "FAULT_INJECTION":
+        _injector = None
+    elif setting in ("PASSWORD_HASHERS", "EMAIL_BACKEND") and get_fault_settings()[
+        "ENABLED"
+    ]:
+        install()
+
+
+# Hooks
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    injector = get_injector()
+    if injector is not None:
+        injector.inject("DB", sql)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _wrap_new_connection(connection, **kwargs):
+    # At the bottom of the stack: this can fire inside another
+    # execute_wrapper() block (QueryBudgetMiddleware), which pops the top
+    # entry on exit
+    if _installed.is_set() and _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _db_wrapper)
+
+
+_local = threading.local()
+_patched = []  # (class, method name, original, defined on the class itself)
+
+
+def _wrap_method(cls, name, target):
+    """Class-level wrapper so cached instances (get_hashers) are covered too"""
+    original = getattr(cls, name)
+    if getattr(original, "_fault_target", None):
+        return
+
+    @functools.wraps(original)
+    def wrapper(self, *args, **kwargs):
+        injector = get_injector()
+        # Once per outer call: PBKDF2/MD5 verify() calls encode() itself
+        if injector is None or getattr(_local, target, False):
+            return original(self, *args, **kwargs)
+        injector.inject(target)
+        setattr(_local, target, True)
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            setattr(_local, target, False)
+
+    wrapper._fault_target = target
+    _patched.append((cls, name, original, name in vars(cls)))
+    setattr(cls, name, wrapper)
+
+
+_installed = threading.Event()
+
+
+def install():
+    """
+    Hooks the configured email backend, every configured password hasher
+    and every DB connection. Hooks do nothing until FAULT_INJECTION
+    ["ENABLED"] is true, so scenarios can switch faults at runtime.
+    """
+    _installed.set()
+    for connection in connections.all(initialized_only=True):
+        _wrap_new_connection(connection)
+    for hasher in get_hashers():
+        _wrap_method(type(hasher), "encode", "HASHER")
+        _wrap_method(type(hasher), "verify", "HASHER")
+    _wrap_method(type(get_connection()), "send_messages", "EMAIL")
+
+
+def uninstall():
+    """Restores the patched classes and unhooks this thread's connections"""
+    _installed.clear()
+    while _patched:
+        cls, name, original, own = _patched.pop()
+        if own:
+            setattr(cls, name, original)
+        else:
+            delattr(cls, name)
+    for connection in connections.all(initialized_only=True):
+        if _db_wrapper in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_db_wrapper)
@@ -0,0 +1,105 @@
+import json
+import re
+from collections import deque
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from authentication.audit import JsonlSink, get_audit_settings
+from authentication.models import AuditEvent
+
+RELATIVE = re.compile(r"^(\d+)([mhd])$")
+UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_since(value):
+    match = RELATIVE.match(value)
+    if match:
+        return timezone.now() - timedelta(**{UNITS[match.group(2)]: int(match.group(1))})
+    parsed = parse_datetime(value) or parse_datetime(f"{value}T00:00:00")
+    if parsed is None:
+        raise CommandError(f"Can't parse --since {value!r} (use ISO date/time or 30m/2h/7d).")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Query the auth audit log (JSONL segments or the AuditEvent table)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", help="e.g. login_failed")
+        parser.add_argument("--email")
+        parser.add_argument("--user-id")
+        parser.add_argument("--ip")
+        parser.add_argument("--since", help="ISO date/time, or 30m / 2h / 7d")
+        parser.add_argument("--limit", type=int, default=100, help="Newest N events")
+        parser.add_argument("--json", action="store_true", help="Output JSON lines")
+
+    def handle(self, *args, **options):
+        since = parse_since(options["since"]) if options["since"] else None
+        conf = get_audit_settings()
+
+        if conf["SINK"] == "database":
+            events = self._from_database(options, since)
+        else:
+            directory = Path(conf["DIRECTORY"])
+            if not directory.is_absolute():
+                directory = settings.BASE_DIR / directory
+            events = self._from_segments(directory, options, since)
+
+        for event in events:
+            if options["json"]:
+                self.stdout.write(json.dumps(event, default=str))
+            else:
+                data = " ".join(f"{k}={v}" for k, v in (event["data"] or {}).items())
+                self.stdout.write(
+                    f"{event['ts']}  {event['event']:<24} {event['email'] or '-'}  "
+                    f"{event['ip'] or '-'}  {data}".rstrip()
+                )
+
+    def _from_segments(self, directory, options, since):
+        newest = deque(maxlen=options["limit"])
+        for event in JsonlSink.read(directory):
+            if options["event"] and event["event"] != options["event"]:
+                continue
+            if options["email"] and event["email"] != options["email"]:
+                continue
+            if options["user_id"] and event["user_id"] != options["user_id"]:
+                continue
+            if options["ip"] and event["ip"] != options["ip"]:
+                continue
+            if since and parse_datetime(event["ts"]) < since:
+                continue
+            newest.append(event)
+        return list(newest)
+
+    def _from_database(self, options, since):
+        qs = AuditEvent.objects.all()
+        if options["event"]:
+            qs = qs.filter(event=options["event"])
+        if options["email"]:
+            qs = qs.filter(email=options["email"])
+        if options["user_id"]:
+            qs = qs.filter(user_id=options["user_id"])
+        if options["ip"]:
+            qs = qs.filter(ip=options["ip"])
+        if since:
+            qs = qs.filter(created_at__gte=since)
+
+        rows = reversed(qs.order_by("-created_at", "-id")[: options["limit"]])
+        return [
+            {
+                "ts": row.created_at.isoformat(),
+                "event": row.event,
+                "user_id": str(row.user_id) if row.user_id else None,
+                "email": row.email or None,
+                "ip": row.ip or None,
+                "data": row.data,
+            }
+            for row in rows
+        ]
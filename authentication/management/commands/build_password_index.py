@@ -0,0 +1,107 @@
+import gzip
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.password_validation import CommonPasswordValidator
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.validators import (
+    DEFAULT_HASH_WIDTH,
+    password_digest,
+    write_password_index,
+)
+
+HIBP_LINE = re.compile(r"^([0-9A-Fa-f]{40})(?::(\d+))?$")
+
+
+def _open_text(path):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the memory-mapped breached/common password index used by "
+        "BreachedPasswordValidator. Sources may be plain password lists "
+        "(one per line, optionally gzipped) or HIBP SHA-1 dumps (HASH:COUNT)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("sources", nargs="*", help="Password list files")
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Index path (defaults to settings.BREACHED_PASSWORDS_INDEX)",
+        )
+        parser.add_argument(
+            "--width",
+            type=int,
+            default=DEFAULT_HASH_WIDTH,
+            help="Bytes of SHA-1 kept per entry (smaller = smaller file, more false positives)",
+        )
+        parser.add_argument(
+            "--min-count",
+            type=int,
+            default=1,
+            help="Skip HIBP entries seen fewer times than this",
+        )
+        parser.add_argument(
+            "--no-django-common",
+            action="store_true",
+            help="Don't include Django's bundled common password list",
+        )
+
+    def handle(self, *args, **options):
+        width = options["width"]
+        if not 4 <= width <= DEFAULT_HASH_WIDTH:
+            raise CommandError(f"--width must be between 4 and {DEFAULT_HASH_WIDTH}.")
+
+        output = Path(options["output"] or settings.BREACHED_PASSWORDS_INDEX)
+        output.parent.mkdir(parents=True, exist_ok=True)
+
+        sources = [Path(s) for s in options["sources"]]
+        if not options["no_django_common"]:
+            sources.insert(0, CommonPasswordValidator().DEFAULT_PASSWORD_LIST_PATH)
+        if not sources:
+            raise CommandError("No password sources given.")
+
+        for source in sources:
+            if not source.exists():
+                raise CommandError(f"{source} does not exist.")
+
+        started = time.monotonic()
+        written = write_password_index(
+            output, self._read_sources(sources, width, options["min_count"]), width
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} hashes ({width} bytes each) to {output} "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        )
+
+    def _read_sources(self, sources, width, min_count):
+        # A generator, so write_password_index never holds a whole list
+        for source in sources:
+            entries = 0
+            for digest in self._read_source(source, width, min_count):
+                entries += 1
+                yield digest
+            self.stdout.write(f"{source}: {entries} entries")
+
+    def _read_source(self, path, width, min_count):
+        with _open_text(path) as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if not line:
+                    continue
+                match = HIBP_LINE.match(line)
+                if match:
+                    if match.group(2) and int(match.group(2)) < min_count:
+                        continue
+                    yield bytes.fromhex(match.group(1))[:width]
+                else:
+                    yield password_digest(line, width)
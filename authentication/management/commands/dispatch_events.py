@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from authentication.events import Dispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver outbox events (user.registered, user.verified, "
+        "user.deactivated) to the endpoints in settings.WEBHOOKS. Runs once, "
+        "or keeps polling with --loop. Covers every user shard, or only the "
+        "--database ones (to run one dispatcher per database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument(
+            "--interval", type=float, default=1.0, help="Seconds between idle polls"
+        )
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="databases",
+            choices=list(settings.DATABASES),
+            help="Only dispatch this database's outbox (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(databases=options["databases"])
+        if not dispatcher.endpoints:
+            self.stdout.write(self.style.WARNING("No webhook endpoints configured."))
+
+        while True:
+            started = time.monotonic()
+            stats = dispatcher.run_once()
+            if stats["delivered"] or stats["retrying"] or stats["failed"]:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Delivered {stats['delivered']}, retrying "
+                        f"{stats['retrying']}, failed {stats['failed']} "
+                        f"({stats['fanned_out']} new events) in {elapsed:.1f}s"
+                    )
+                )
+            if stats["purged"]:
+                self.stdout.write(f"Purged {stats['purged']} delivered events")
+            if not options["loop"]:
+                break
+            # Busy: go again straight away; idle: wait for new events
+            if not (stats["delivered"] or stats["retrying"] or stats["failed"]):
+                time.sleep(options["interval"])
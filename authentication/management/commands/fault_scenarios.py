@@ -0,0 +1,271 @@
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication import faults
+from authentication.admission import admission_stats, reset_pools
+from authentication.models import CustomUser
+
+PASSWORD = "Kp9!vRz#Lmq2"
+
+# name -> FAULT_INJECTION targets (see authentication/faults.py)
+SCENARIOS = {
+    "baseline": {},
+    # Gmail SMTP hanging for 10 s on every send
+    "slow_smtp": {"EMAIL": {"LATENCY": {"DISTRIBUTION": "fixed", "MS": 10_000}}},
+    # One send in five dropped by the SMTP server
+    "smtp_errors": {"EMAIL": {"ERROR_RATE": 0.2}},
+    # SQLite writers waiting on the file lock, and sometimes giving up
+    "sqlite_locked": {
+        "DB": {
+            "MATCH": r"^\s*(INSERT|UPDATE|DELETE)",
+            "LATENCY": {"DISTRIBUTION": "exponential", "MEAN_MS": 50, "MAX_MS": 5000},
+            "ERROR_RATE": 0.1,
+        }
+    },
+    # Hashing on a starved or throttled CPU
+    "slow_hashing": {
+        "HASHER": {"LATENCY": {"DISTRIBUTION": "lognormal", "MEDIAN_MS": 250, "SIGMA": 0.6}}
+    },
+}
+
+ENDPOINTS = ("register", "login", "refresh", "me")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run register/login/refresh/me traffic under injected faults (slow or "
+        "failing SMTP, locked SQLite, slow hashing) against a throwaway test "
+        "database, and report throughput, error rates and latency per "
+        "endpoint plus admission pool shedding for each scenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})",
+        )
+        parser.add_argument(
+            "--file",
+            help='JSON file of extra scenarios: {"name": {"EMAIL": {...}, ...}}',
+        )
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--fast-hashers",
+            action="store_true",
+            help="Hash with MD5 so the injected faults dominate",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only")
+
+    def handle(self, *args, **options):
+        scenarios = dict(SCENARIOS)
+        if options["file"]:
+            scenarios.update(json.loads(Path(options["file"]).read_text()))
+        names = options["scenarios"] or list(scenarios)
+        unknown = [name for name in names if name not in scenarios]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+
+        self.options = options
+        self.sequence = itertools.count()
+        overrides = {}
+        if options["fast_hashers"]:
+            overrides["PASSWORD_HASHERS"] = [
+                "django.contrib.auth.hashers.MD5PasswordHasher"
+            ]
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()  # locmem email backend
+        with tempfile.TemporaryDirectory() as tmp:
+            # File databases: an in-memory SQLite can't take concurrent writers
+            for alias in connections:
+                connection = connections[alias]
+                if connection.vendor == "sqlite":
+                    connection.settings_dict["TEST"]["NAME"] = f"{tmp}/{alias}.sqlite3"
+            old_config = runner.setup_databases()
+            try:
+                with override_settings(
+                    AUDIT_LOG={"SINK": "jsonl", "DIRECTORY": Path(tmp) / "audit"},
+                    **overrides,
+                ):
+                    faults.install()
+                    accounts = self.make_accounts(options["users"])
+                    report = {
+                        name: self.run_scenario(scenarios[name], accounts)
+                        for name in names
+                    }
+            finally:
+                faults.uninstall()
+                runner.teardown_databases(old_config)
+                runner.teardown_test_environment()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for name, result in report.items():
+                self.write_report(name, result)
+
+    def make_accounts(self, count):
+        accounts = []
+        for i in range(count):
+            user = CustomUser.objects.create_user(
+                email=f"fault-user-{i}@example.com",
+                password=PASSWORD,
+                is_verified=True,
+            )
+            refresh = RefreshToken.for_user(user)
+            accounts.append(
+                {
+                    "email": user.email,
+                    "refresh": str(refresh),
+                    "access": str(refresh.access_token),
+                }
+            )
+        return accounts
+
+    def run_scenario(self, targets, accounts):
+        conf = {"ENABLED": True, "SEED": self.options["seed"], **targets}
+        results = {endpoint: [] for endpoint in ENDPOINTS}
+        reset_pools()
+        mail.outbox = []
+        with override_settings(FAULT_INJECTION=conf):
+            injector = faults.get_injector()
+            started = time.monotonic()
+            deadline = started + self.options["duration"]
+            workers = [
+                threading.Thread(
+                    target=self.worker, args=(deadline, accounts, results, n)
+                )
+                for n in range(self.options["concurrency"])
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.monotonic() - started
+
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            calls = results[endpoint]
+            statuses = [status for status, _ in calls]
+            latencies = [ms for _, ms in calls]
+            total = len(calls)
+            ok = sum(1 for status in statuses if 200 <= status < 300)
+            endpoints[endpoint] = {
+                "requests": total,
+                "rps": round(total / elapsed, 2),
+                "ok": ok,
+                "client_errors": sum(1 for s in statuses if 400 <= s < 500),
+                "shed": statuses.count(503),
+                "server_errors": sum(1 for s in statuses if s >= 500 and s != 503),
+                "error_rate": round(1 - ok / total, 3) if total else None,
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99),
+            }
+        return {
+            "faults": targets,
+            "seconds": round(elapsed, 2),
+            "endpoints": endpoints,
+            "injected": dict(injector.stats),
+            "admission": admission_stats(),
+        }
+
+    def worker(self, deadline, accounts, results, n):
+        client = APIClient(raise_request_exception=False)
+        rng = random.Random(n)
+        try:
+            for endpoint in itertools.cycle(ENDPOINTS):
+                if time.monotonic() >= deadline:
+                    break
+                # A fresh client address per request, as from many users, so
+                # the per-IP throttles don't end the run early
+                seq = next(self.sequence)
+                address = f"10.{seq >> 16 & 255}.{seq >> 8 & 255}.{seq & 255}"
+                account = rng.choice(accounts)
+
+                started = time.perf_counter()
+                response = self.request(client, endpoint, account, seq, address)
+                ms = round((time.perf_counter() - started) * 1000, 1)
+                results[endpoint].append((response.status_code, ms))
+        finally:
+            connections.close_all()
+
+    def request(self, client, endpoint, account, seq, address):
+        if endpoint == "register":
+            data = {
+                "email": f"fault-register-{seq}@example.com",
+                "password": PASSWORD,
+                "first_name": "Load",
+                "last_name": "Test",
+            }
+            return client.post(
+                "/api/auth/register/", data, format="json", REMOTE_ADDR=address
+            )
+        if endpoint == "login":
+            data = {"email": account["email"], "password": PASSWORD}
+            return client.post(
+                "/api/auth/login/", data, format="json", REMOTE_ADDR=address
+            )
+        if endpoint == "refresh":
+            data = {"refresh": account["refresh"]}
+            return client.post(
+                "/api/auth/refresh/", data, format="json", REMOTE_ADDR=address
+            )
+        return client.get(
+            "/api/auth/me/",
+            HTTP_AUTHORIZATION=f"Bearer {account['access']}",
+            REMOTE_ADDR=address,
+        )
+
+    def write_report(self, name, result):
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(f"{name} ({result['seconds']}s): {result['faults']}")
+        )
+        self.stdout.write(
+            f"  {'endpoint':<10}{'req':>7}{'rps':>9}{'ok':>7}{'4xx':>6}{'503':>6}"
+            f"{'5xx':>6}{'err%':>8}{'p50':>9}{'p95':>9}{'p99':>9}"
+        )
+        for endpoint, row in result["endpoints"].items():
+            error_rate = "-" if row["error_rate"] is None else f"{row['error_rate']:.1%}"
+            latencies = "".join(
+                f"{'-' if row[key] is None else round(row[key]):>9}"
+                for key in ("p50_ms", "p95_ms", "p99_ms")
+            )
+            self.stdout.write(
+                f"  {endpoint:<10}{row['requests']:>7}{row['rps']:>9}{row['ok']:>7}"
+                f"{row['client_errors']:>6}{row['shed']:>6}{row['server_errors']:>6}"
+                f"{error_rate:>8}{latencies}"
+            )
+        if result["injected"]:
+            injected = ", ".join(f"{k}={v}" for k, v in sorted(result["injected"].items()))
+            self.stdout.write(f"  injected: {injected}")
+        for pool, stats in result["admission"].items():
+            self.stdout.write(
+                f"  pool {pool}: concurrency {stats['concurrency']}, shed "
+                f"{stats['shed']}, max queue {stats['max_queue_depth']}, "
+                f"avg hold {stats['avg_hold_ms']}ms"
+            )
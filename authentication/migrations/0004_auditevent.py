@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_alter_customuser_otp_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=50)),
+                ('user_id', models.UUIDField(blank=True, null=True)),
+                ('email', models.CharField(blank=True, max_length=254)),
+                ('ip', models.CharField(blank=True, max_length=100)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'created_at'], name='authenticat_event_17ab8b_idx'), models.Index(fields=['email', 'created_at'], name='authenticat_email_f0423d_idx'), models.Index(fields=['user_id', 'created_at'], name='authenticat_user_id_5aa019_idx')],
+            },
+        ),
+    ]
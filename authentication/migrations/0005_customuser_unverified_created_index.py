@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('authentication', '0004_auditevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['created_at', 'id'], name='user_unverified_created_idx'),
+        ),
+    ]
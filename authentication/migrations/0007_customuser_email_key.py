@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_customuser_created_index'),
+    ]
+
+    operations = [
+        # Nullable until 0008 backfills it; 0009 adds the unique index
+        migrations.AddField(
+            model_name='customuser',
+            name='email_key',
+            field=models.CharField(editable=False, max_length=254, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill_email_key(apps, schema_editor):
+    """
+    Sets email_key = lowercased email in pk-ordered batches, each committed
+    on its own so the table is never locked for long. Re-runnable: rows
+    that already have a key are skipped.
+    """
+    CustomUser = apps.get_model("authentication", "CustomUser")
+    db = schema_editor.connection.alias
+    users = CustomUser.objects.using(db).order_by("pk")
+
+    last = None
+    while True:
+        page = users if last is None else users.filter(pk__gt=last)
+        batch = list(page.only("pk", "email", "email_key")[:BATCH_SIZE])
+        if not batch:
+            break
+        last = batch[-1].pk
+
+        todo = [user for user in batch if user.email_key is None]
+        for user in todo:
+            user.email_key = user.email.strip().lower()
+        if todo:
+            with transaction.atomic(using=db):
+                CustomUser.objects.using(db).bulk_update(todo, ["email_key"])
+
+    # 0009 makes email_key unique; name the accounts that would block it
+    clashes = list(
+        CustomUser.objects.using(db)
+        .values("email_key")
+        .annotate(n=models.Count("pk"))
+        .filter(n__gt=1)
+        .order_by("email_key")
+        .values_list("email_key", flat=True)[:20]
+    )
+    if clashes:
+        raise RuntimeError(
+            "These emails exist in more than one casing; merge or rename the "
+            "accounts, then re-run migrate: " + ", ".join(clashes)
+        )
+
+
+class Migration(migrations.Migration):
+
+    # Each batch commits separately (see backfill_email_key)
+    atomic = False
+
+    dependencies = [
+        ('authentication', '0007_customuser_email_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_email_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_backfill_customuser_email_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='email_key',
+            field=models.CharField(editable=False, max_length=254, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_outboxevent_webhookdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='otp_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
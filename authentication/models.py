@@ -1,20 +1,25 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import (
     AbstractBaseUser,
     PermissionsMixin,
     BaseUserManager,
 )
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import timedelta
 import secrets
 
+from .sharding import ShardedUserQuerySet, make_user_id, normalize_email_key
 
-class CustomUserManager(BaseUserManager):
+
+class CustomUserManager(BaseUserManager.from_queryset(ShardedUserQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError("The email field must be set")
         email = self.normalize_email(email)
+        # id carries the email's shard bucket (see sharding.py)
+        extra_fields.setdefault("id", make_user_id(email))
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
@@ -31,10 +36,19 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def with_email(self, email):
+        """Case-insensitive email match: one seek on the unique email_key index"""
+        return self.filter(email_key=normalize_email_key(email))
+
+    def get_by_natural_key(self, email):
+        return self.with_email(email).get()
+
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(unique=True)
+    # Lowercased copy of email, kept in sync by save(); all lookups use it
+    email_key = models.CharField(max_length=254, unique=True, editable=False)
     first_name = models.CharField(max_length=150, blank=True)
     last_name = models.CharField(max_length=150, blank=True)
     avatar_id = models.CharField(
@@ -45,6 +59,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     otp_code = models.CharField(max_length=6, blank=True, null=True)
     otp_created_at = models.DateTimeField(null=True, blank=True)
     otp_expiry = models.DateTimeField(null=True, blank=True)
+    # Last verification email; spaces resends across all workers (see resend_otp)
+    otp_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -57,9 +73,48 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            # Admin changelist order (newest first, scanned backwards)
+            models.Index(fields=["created_at", "id"], name="user_created_idx"),
+            # purge_unverified_users pages unverified rows by age. Partial
+            # rather than (is_verified, created_at): Django emits
+            # `NOT is_verified`, which can't seek on a leading bool column
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(is_verified=False),
+                name="user_unverified_created_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.email
 
+    def clean(self):
+        super().clean()
+        # email_key isn't a form field, so ModelForm won't check its uniqueness
+        if (
+            self.email
+            and CustomUser.objects.with_email(self.email).exclude(pk=self.pk).exists()
+        ):
+            raise ValidationError({"email": "This email is already registered."})
+
+    def deactivate(self):
+        """Disable the account and publish user.deactivated atomically"""
+        from . import events
+
+        with transaction.atomic(using=self._state.db):
+            self.is_active = False
+            self.save(update_fields=["is_active", "updated_at"])
+            events.publish("user.deactivated", self)
+
+    def save(self, *args, **kwargs):
+        self.email_key = normalize_email_key(self.email)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "email" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "email_key"}
+        super().save(*args, **kwargs)
+
     def generate_otp(self):
         """Generate 6-digit OTP and set expiry(5 mins)"""
         import random
@@ -79,9 +134,97 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
             return True, "OTP is valid."
         return False, "Invalid verification code."
 
-    def clear_otp(self):
+    def clear_otp(self, save=True):
         """Invalidate OTP after successful validation"""
         self.otp_code = None
         self.otp_created_at = None
         self.otp_expiry = None
-        self.save(update_fields=["otp_code", "otp_created_at", "otp_expiry"])
+        if save:
+            self.save(update_fields=["otp_code", "otp_created_at", "otp_expiry"])
+
+
+class AuditEvent(models.Model):
+    """
+    Append-only auth audit trail (used when AUDIT_LOG["SINK"] == "database").
+    Written in batches by authentication.audit; user_id is a plain column,
+    not a FK, so events outlive the user and inserts need no lookups.
+    """
+
+    event = models.CharField(max_length=50)
+    user_id = models.UUIDField(null=True, blank=True)
+    email = models.CharField(max_length=254, blank=True)
+    ip = models.CharField(max_length=100, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["event", "created_at"]),
+            models.Index(fields=["email", "created_at"]),
+            models.Index(fields=["user_id", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.event} {self.email}"
+
+
+class OutboxEvent(models.Model):
+    """
+    User lifecycle event (user.registered, ...), written by
+    authentication.events.publish in the same transaction as the change it
+    describes, on the same database as the user. The dispatcher fans each
+    event out into one WebhookDelivery per subscribed endpoint.
+    """
+
+    event = models.CharField(max_length=50)
+    user_id = models.UUIDField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    fanned_out = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(fanned_out=False),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.event} {self.user_id}"
+
+
+class WebhookDelivery(models.Model):
+    """One event's delivery state for one endpoint in settings.WEBHOOKS"""
+
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"  # gave up after MAX_ATTEMPTS
+
+    event = models.ForeignKey(
+        OutboxEvent, on_delete=models.CASCADE, related_name="deliveries"
+    )
+    endpoint = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "endpoint"], name="webhook_delivery_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["endpoint", "next_attempt_at"],
+                condition=models.Q(status="pending"),
+                name="webhook_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} -> {self.endpoint} ({self.status})"
@@ -0,0 +1,156 @@
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MODE": "log",  # "log" or "raise"
+    "REPEAT_THRESHOLD": 3,  # same statement shape this often in one request = N+1
+}
+
+# Transaction bookkeeping isn't a data query
+IGNORED = re.compile(
+    r"^\s*(BEGIN|SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b", re.I
+)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)", re.I)
+WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_budget_settings():
+    return {**DEFAULTS, **getattr(settings, "QUERY_BUDGET", {})}
+
+
+def fingerprint(sql):
+    """Statement shape with literals and IN-lists collapsed"""
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = IN_LIST.sub("IN (...)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper() callable that counts and fingerprints.
+    Shapes and statements are keyed by database alias: the same lookup on a
+    replica or on each user shard is not a repeat.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.fingerprints = Counter()
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not IGNORED.match(sql):
+            alias = context["connection"].alias
+            self.count += 1
+            self.fingerprints[(alias, fingerprint(sql))] += 1
+            self.statements[(alias, sql, repr(params))] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """(alias, statement shape) run at least `threshold` times"""
+        return {key: n for key, n in self.fingerprints.items() if n >= threshold}
+
+    def duplicates(self):
+        """(alias, SQL) run more than once with exactly the same params"""
+        return {
+            (alias, sql): n for (alias, sql, _), n in self.statements.items() if n > 1
+        }
+
+
+@contextmanager
+def count_queries():
+    """Counts queries on every configured database inside the block"""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+@contextmanager
+def assert_max_queries(budget, label="block"):
+    """Test helper: fail if the block runs more than `budget` queries"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(
+            f"{label} ran {counter.count} queries (budget {budget}):\n"
+            + "\n".join(
+                f"  {n}x on {alias}: {fp}"
+                for (alias, fp), n in counter.fingerprints.items()
+            )
+        )
+
+
+def enforce_query_budgets():
+    """Test helper: make every budget overrun or N+1 fail the request"""
+    return override_settings(QUERY_BUDGET={**get_budget_settings(), "MODE": "raise"})
+
+
+def get_query_budget(request):
+    """
+    Budget declared on the resolved view as `query_budget`: an int, or a
+    dict keyed by viewset action ("create") or HTTP method ("get").
+    """
+    match = getattr(request, "resolver_match", None)
+    view_class = match and getattr(match.func, "cls", None)
+    budget = getattr(view_class, "query_budget", None)
+    if not isinstance(budget, dict):
+        return budget
+
+    method = request.method.lower()
+    action = (getattr(match.func, "actions", None) or {}).get(method)
+    return budget.get(action, budget.get(method))
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts and fingerprints the queries of each request, and reports when
+    the view's query_budget is exceeded, one statement shape repeats
+    REPEAT_THRESHOLD times, or an identical statement (same SQL and params)
+    runs twice on the same database. Reports are logged; in "raise" mode,
+    which the test runner turns on, they raise QueryBudgetExceeded instead.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        conf = get_budget_settings()
+        budget = get_query_budget(request)
+        problems = []
+        if budget is not None and counter.count > budget:
+            problems.append(f"{counter.count} queries, budget is {budget}")
+        for (alias, fp), n in counter.repeated(conf["REPEAT_THRESHOLD"]).items():
+            problems.append(f"repeated {n}x on {alias} (possible N+1): {fp}")
+        for (alias, sql), n in counter.duplicates().items():
+            problems.append(
+                f"identical statement run {n}x on {alias}: {fingerprint(sql)}"
+            )
+
+        if problems:
+            message = f"{request.method} {request.path}: " + "; ".join(problems)
+            if conf["MODE"] == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = str(counter.count)
+        return response
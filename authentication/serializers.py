@@ -1,11 +1,35 @@
 # authentication/serializers.py
+from django.contrib.auth import password_validation
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import router, transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
+from . import audit, events
+from .admission import admitted
+from .db_routers import get_replicas, use_primary
 from .models import CustomUser
-from .utils import generate_and_send_otp
+from .tokens import get_user_for_reset_token
+from .utils import (
+    generate_and_send_otp,
+    invalidate_me_cache,
+    resend_otp,
+    send_password_reset_email,
+)
 import re
 
 
+def run_password_validators(password, user=None):
+    """
+    Runs settings.AUTH_PASSWORD_VALIDATORS (incl. the breached password index)
+    and re-raises failures as DRF validation errors
+    """
+    try:
+        password_validation.validate_password(password, user=user)
+    except DjangoValidationError as e:
+        raise serializers.ValidationError(list(e.messages))
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Full user details returned after successful verification
@@ -26,6 +50,51 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "is_verified", "created_at", "updated_at"]
 
 
+class ProfileChanged(Exception):
+    """The user row changed between reading it and writing a PATCH"""
+
+
+class MeSerializer(UserSerializer):
+    """
+    GET/PATCH /auth/me/
+    Profile fields the user may edit themselves (email is fixed)
+    """
+
+    class Meta(UserSerializer.Meta):
+        read_only_fields = UserSerializer.Meta.read_only_fields + ["email"]
+
+    def update(self, instance, validated_data):
+        precondition = self.context.get("precondition", False)
+        if not precondition and instance._state.db in get_replicas():
+            # No If-Match: last write wins. An instance read from a replica
+            # may lag behind, so diff against the primary's row instead
+            with use_primary():
+                instance = CustomUser.objects.get(pk=instance.pk)
+
+        changed = {
+            field: value
+            for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        }
+        if not changed:
+            return instance
+
+        # UPDATE only the changed columns. With If-Match, only if the row
+        # still has the updated_at we read (optimistic lock, no re-SELECT).
+        # updated_at drives the ETag, so it's always part of the write.
+        rows = CustomUser.objects.filter(pk=instance.pk)
+        if precondition:
+            rows = rows.filter(updated_at=instance.updated_at)
+        changed["updated_at"] = timezone.now()
+        if not rows.update(**changed):
+            raise ProfileChanged()
+
+        for field, value in changed.items():
+            setattr(instance, field, value)
+        invalidate_me_cache(instance.pk)  # .update() sends no post_save
+        return instance
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     """
     Registration input serializer
@@ -49,9 +118,12 @@ class RegisterSerializer(serializers.ModelSerializer):
             "last_name",
             "avatar_id",
         ]
+        # validate_email does the uniqueness check (with our message), so
+        # drop the UniqueValidator that would repeat the same query
+        extra_kwargs = {"email": {"validators": []}}
 
     def validate_email(self, value):
-        if CustomUser.objects.filter(email=value).exists():
+        if CustomUser.objects.with_email(value).exists():
             raise serializers.ValidationError("This email is already registered.")
         return value
 
@@ -72,17 +144,32 @@ class RegisterSerializer(serializers.ModelSerializer):
                 "Password must contain at least one special character."
             )
 
+        # Unsaved user so the similarity check can compare against email/name
+        user = CustomUser(
+            email=self.initial_data.get("email", ""),
+            first_name=self.initial_data.get("first_name", ""),
+            last_name=self.initial_data.get("last_name", ""),
+        )
+        run_password_validators(value, user)
+
         return value
 
     def create(self, validated_data):
-        # Create user (unverified)
-        user = CustomUser.objects.create_user(
-            email=validated_data["email"],
-            password=validated_data["password"],
-            first_name=validated_data.get("first_name", ""),
-            last_name=validated_data.get("last_name", ""),
-            avatar_id=validated_data.get("avatar_id", None),
-        )
+        # Create user (unverified) and its outbox event together, on the
+        # database (shard) the user is written to. The hashing slot covers
+        # the hash and these writes only, not the OTP email below.
+        email = validated_data["email"]
+        with admitted("hashing"), transaction.atomic(
+            using=router.db_for_write(CustomUser, instance=CustomUser(email=email))
+        ):
+            user = CustomUser.objects.create_user(
+                email=email,
+                password=validated_data["password"],
+                first_name=validated_data.get("first_name", ""),
+                last_name=validated_data.get("last_name", ""),
+                avatar_id=validated_data.get("avatar_id", None),
+            )
+            events.publish("user.registered", user)
 
         # Generate and send OTP
         otp = generate_and_send_otp(user)
@@ -104,9 +191,16 @@ class VerifyOTPSerializer(serializers.Serializer):
     code = serializers.CharField(max_length=6, min_length=6)  # ← Changed to 6 digits?
 
     def validate(self, attrs):
+        request = self.context.get("request")
         try:
             user = CustomUser.objects.get(id=attrs["user_id"])
         except CustomUser.DoesNotExist:
+            audit.record(
+                "verify_failed",
+                request,
+                user_id=attrs["user_id"],
+                reason="user_not_found",
+            )
             raise serializers.ValidationError({"user_id": "User not found."})
 
         is_valid, message = user.is_otp_valid(
@@ -114,6 +208,7 @@ class VerifyOTPSerializer(serializers.Serializer):
         )  # ← Now expects tuple (bool, str)
 
         if not is_valid:
+            audit.record("verify_failed", request, user=user, reason=message)
             raise serializers.ValidationError(
                 {"code": message}
             )  # ← Correct error raising
@@ -129,9 +224,21 @@ class VerifyOTPSerializer(serializers.Serializer):
     def save(self):
         user = self.validated_data["user"]
 
+        # One UPDATE for verification + clearing the OTP, committed together
+        # with its outbox event
         user.is_verified = True
-        user.clear_otp()
-        user.save(update_fields=["is_verified"])
+        user.clear_otp(save=False)
+        with transaction.atomic(using=user._state.db):
+            user.save(
+                update_fields=[
+                    "is_verified",
+                    "otp_code",
+                    "otp_created_at",
+                    "otp_expiry",
+                    "updated_at",
+                ]
+            )
+            events.publish("user.verified", user)
 
         refresh = RefreshToken.for_user(user)
 
@@ -142,6 +249,38 @@ class VerifyOTPSerializer(serializers.Serializer):
         }
 
 
+class ResendOTPSerializer(serializers.Serializer):
+    """
+    OTP resend input
+    """
+
+    user_id = serializers.UUIDField()
+
+    def validate(self, attrs):
+        try:
+            user = CustomUser.objects.get(id=attrs["user_id"])
+        except CustomUser.DoesNotExist:
+            raise serializers.ValidationError({"user_id": "User not found."})
+
+        if user.is_verified:
+            raise serializers.ValidationError(
+                {"user_id": "This account is already verified."}
+            )
+
+        attrs["user"] = user
+        return attrs
+
+    def save(self):
+        result = resend_otp(self.validated_data["user"])
+
+        if result.outcome == "failed":
+            raise serializers.ValidationError(
+                "Failed to send verification code. Please try again later."
+            )
+
+        return result
+
+
 # Login
 
 
@@ -154,23 +293,30 @@ class LoginSerializer(serializers.Serializer):
     def validate(self, attrs):
         email = attrs.get("email")
         password = attrs.get("password")
+        request = self.context.get("request")
 
         try:
-            user = CustomUser.objects.get(email=email)
+            user = CustomUser.objects.get_by_natural_key(email)
         except CustomUser.DoesNotExist:
+            audit.record("login_failed", request, email=email, reason="unknown_email")
             raise serializers.ValidationError(
                 {"email": "No account found with this email."}
             )
 
-        if not user.check_password(password):
+        with admitted("hashing"):
+            password_ok = user.check_password(password)
+        if not password_ok:
+            audit.record("login_failed", request, user=user, reason="bad_password")
             raise serializers.ValidationError({"password": "Incorrect password."})
 
         if not user.is_verified:
+            audit.record("login_failed", request, user=user, reason="unverified")
             raise serializers.ValidationError(
                 {"email": "Account is not verified. Please check your email."}
             )
 
         if not user.is_active:
+            audit.record("login_failed", request, user=user, reason="inactive")
             raise serializers.ValidationError("This account has been disabled.")
 
         attrs["user"] = user
@@ -183,10 +329,24 @@ class LoginSerializer(serializers.Serializer):
 class PasswordResetRequestSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
 
-    def validate_email(self, value):
-        if not CustomUser.objects.filter(email=value).exists():
-            raise serializers.ValidationError("No user with this email address.")
-        return value
+    def validate(self, attrs):
+        try:
+            attrs["user"] = CustomUser.objects.get_by_natural_key(attrs["email"])
+        except CustomUser.DoesNotExist:
+            raise serializers.ValidationError(
+                {"email": "No user with this email address."}
+            )
+        return attrs
+
+    def save(self):
+        user = self.validated_data["user"]
+
+        if not send_password_reset_email(user):
+            raise serializers.ValidationError(
+                "Failed to send password reset email. Please try again later."
+            )
+
+        return user
 
 
 # Password Reset – Confirm (set new password)
@@ -209,3 +369,31 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
                 "Password must contain at least one special character."
             )
         return value
+
+    def validate(self, attrs):
+        user = get_user_for_reset_token(attrs["token"])
+        if user is None:
+            audit.record(
+                "password_reset_failed",
+                self.context.get("request"),
+                reason="invalid_token",
+            )
+            raise serializers.ValidationError(
+                {"token": "This reset link is invalid or has expired."}
+            )
+
+        try:
+            run_password_validators(attrs["new_password"], user)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({"new_password": e.detail})
+        attrs["user"] = user
+        return attrs
+
+    def save(self):
+        user = self.validated_data["user"]
+
+        # New password hash invalidates the token (single use)
+        user.set_password(self.validated_data["new_password"])
+        user.save(update_fields=["password"])
+
+        return user
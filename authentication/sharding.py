@@ -0,0 +1,150 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+# Users are hashed into a fixed number of buckets; buckets map onto shards.
+# The bucket is also stamped into the low 16 bits of every new user id, so
+# lookups by email and by id both resolve to the same shard.
+NUM_BUCKETS = 1 << 16
+BUCKET_MASK = NUM_BUCKETS - 1
+
+EMAIL_LOOKUPS = ("email", "email__exact", "email_key", "email_key__exact")
+ID_LOOKUPS = ("id", "pk", "id__exact", "pk__exact")
+
+
+def get_user_shards():
+    return getattr(settings, "USER_SHARDS", [])
+
+
+def is_sharded():
+    return len(get_user_shards()) > 1
+
+
+def normalize_email_key(email):
+    return email.strip().lower()
+
+
+def bucket_for_email(email):
+    digest = hashlib.blake2b(
+        normalize_email_key(email).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") & BUCKET_MASK
+
+
+def bucket_for_id(user_id):
+    """Bucket stamped into a user id, or None if it isn't a UUID"""
+    try:
+        value = user_id if isinstance(user_id, uuid.UUID) else uuid.UUID(str(user_id))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return value.int & BUCKET_MASK
+
+
+def shard_for_bucket(bucket, shards=None):
+    shards = shards or get_user_shards()
+    return shards[bucket % len(shards)]
+
+
+def shard_for_email(email, shards=None):
+    return shard_for_bucket(bucket_for_email(email), shards)
+
+
+def shard_for_id(user_id, shards=None):
+    bucket = bucket_for_id(user_id)
+    return None if bucket is None else shard_for_bucket(bucket, shards)
+
+
+def make_user_id(email):
+    """Random UUID4 whose low 16 bits carry the email's bucket"""
+    value = (uuid.uuid4().int & ~BUCKET_MASK) | bucket_for_email(email)
+    return uuid.UUID(int=value)
+
+
+def is_user_model(model):
+    return model._meta.label == settings.AUTH_USER_MODEL or (
+        model._meta.auto_created
+        and model._meta.auto_created._meta.label == settings.AUTH_USER_MODEL
+    )
+
+
+class ShardedUserQuerySet(models.QuerySet):
+    """
+    Sends get()/filter() on email or id to the owning shard, so callers
+    keep using CustomUser.objects.with_email(...) / get(email=...) unchanged. Queries with an
+    explicit .using() or without a shard key are left to the routers.
+    """
+
+    def _shard_for_lookup(self, kwargs):
+        if self._db is not None or not is_sharded():
+            return None
+        for key in EMAIL_LOOKUPS:
+            if isinstance(kwargs.get(key), str):
+                return shard_for_email(kwargs[key])
+        for key in ID_LOOKUPS:
+            if key in kwargs:
+                return shard_for_id(kwargs[key])
+        return None
+
+    def get(self, *args, **kwargs):
+        shard = self._shard_for_lookup(kwargs)
+        if shard is None:
+            return super().get(*args, **kwargs)
+
+        try:
+            return self.using(shard).get(*args, **kwargs)
+        except self.model.DoesNotExist:
+            if not any(key in kwargs for key in ID_LOOKUPS):
+                raise
+
+        # Ids issued before sharding don't carry their bucket: try the rest
+        for other in get_user_shards():
+            if other != shard:
+                try:
+                    return self.using(other).get(*args, **kwargs)
+                except self.model.DoesNotExist:
+                    pass
+        raise self.model.DoesNotExist(
+            f"{self.model._meta.object_name} matching query does not exist."
+        )
+
+    def filter(self, *args, **kwargs):
+        shard = self._shard_for_lookup(kwargs)
+        if shard is None:
+            return super().filter(*args, **kwargs)
+        return self.using(shard).filter(*args, **kwargs)
+
+
+class UserShardRouter:
+    """
+    Writes of a user (and its m2m rows) go to the shard of its email; reads
+    that carry an instance stay on that instance's shard. Everything else
+    falls through to the next router.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if is_sharded() and is_user_model(model) and instance is not None:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not is_sharded() or not is_user_model(model):
+            return None
+        instance = hints.get("instance")
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        if getattr(instance, "email", None):
+            return shard_for_email(instance.email)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded() and obj1._state.db == obj2._state.db:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+from .utils import invalidate_me_cache
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def drop_cached_me_response(sender, instance, **kwargs):
+    """Rendered /auth/me/ payloads are stale once the user row changes"""
+    invalidate_me_cache(instance.pk)
@@ -1,3 +1,1864 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from main import staticfiles
+
+from . import audit, events, faults, warmup
+from .admin import estimate_row_count
+from .admission import AdmissionPool, get_pool
+from .db_routers import routing_scope, use_primary
+from .events import (
+    SIGNATURE_HEADER,
+    Dispatcher,
+    get_webhook_settings,
+    publish,
+    verify_signature,
+)
+from .models import AuditEvent, CustomUser, OutboxEvent, WebhookDelivery
+from .query_budget import (
+    QueryBudgetExceeded,
+    assert_max_queries,
+    count_queries,
+)
+from .serializers import MeSerializer
+from .sharding import shard_for_email, shard_for_id
+from .tokens import (
+    ResetTokenGenerator,
+    get_user_for_reset_token,
+    make_password_reset_token,
+)
+from .utils import OTP_RESEND_STATS, otp_resend_stats, resend_otp
+from .validators import (
+    BreachedPasswordValidator,
+    get_password_index,
+    password_digest,
+    write_password_index,
+)
+
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+STRONG_PASSWORD = "Kp9!vRz#Lmq2"
+
+# Extra databases declared in main/settings_test.py: a replica that never
+# receives the primary's writes, and two more user shards
+REPLICA_DB = "replica_test"
+SHARD_DBS = ["default", "shard_test_1", "shard_test_2"]
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class PasswordResetTests(TestCase):
+    def setUp(self):
+        cache.clear()  # throttle counters
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email="ada@example.com", password="Old!Passw0rd", is_verified=True
+        )
+
+    def confirm(self, token, password=STRONG_PASSWORD):
+        return self.client.post(
+            "/api/auth/password/reset/confirm/",
+            {"token": token, "new_password": password},
+            format="json",
+        )
+
+    def test_request_emails_reset_link(self):
+        response = self.client.post(
+            "/api/auth/password/reset/request/",
+            {"email": "ada@example.com"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["ada@example.com"])
+        token = mail.outbox[0].body.split("token=")[1].split()[0]
+        self.assertEqual(get_user_for_reset_token(token), self.user)
+
+    def test_confirm_sets_new_password(self):
+        response = self.confirm(make_password_reset_token(self.user))
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(STRONG_PASSWORD))
+
+    def test_token_is_single_use(self):
+        token = make_password_reset_token(self.user)
+
+        self.assertEqual(self.confirm(token).status_code, 200)
+        response = self.confirm(token, password="An0ther!Secret")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("token", response.data)
+
+    def test_token_expires(self):
+        token = make_password_reset_token(self.user)
+        later = datetime.now() + timedelta(hours=1, seconds=1)
+
+        with mock.patch.object(ResetTokenGenerator, "_now", return_value=later):
+            self.assertIsNone(get_user_for_reset_token(token))
+            self.assertEqual(self.confirm(token).status_code, 400)
+
+    def test_tampered_or_malformed_token_rejected(self):
+        token = make_password_reset_token(self.user)
+        tampered = token[:-1] + ("1" if token.endswith("0") else "0")
+
+        for bad in [tampered, "nope", "a.b", token.split(".")[1]]:
+            self.assertIsNone(get_user_for_reset_token(bad))
+
+    def test_common_password_rejected(self):
+        response = self.confirm(make_password_reset_token(self.user), "Password1!")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("new_password", response.data)
+
+    def test_tokens_are_stateless_and_cheap(self):
+        with self.assertNumQueries(0):
+            started = time.perf_counter()
+            tokens = [make_password_reset_token(self.user) for _ in range(1000)]
+            issued = time.perf_counter() - started
+
+        # Validation is one indexed SELECT and no writes
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_for_reset_token(tokens[0]), self.user)
+
+        started = time.perf_counter()
+        for token in tokens:
+            get_user_for_reset_token(token)
+        checked = time.perf_counter() - started
+
+        self.assertLess(issued, 1.0)
+        self.assertLess(checked, 2.0)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA_DB], PASSWORD_HASHERS=FAST_HASHERS)
+class ReplicaRouterTests(TestCase):
+    databases = {"default", REPLICA_DB}
+
+    def setUp(self):
+        cache.clear()  # throttle counters
+        self.client = APIClient()
+
+    def create_user(self, email="ada@example.com"):
+        with routing_scope():
+            return CustomUser.objects.create_user(
+                email=email, password=STRONG_PASSWORD, is_verified=True
+            )
+
+    def test_reads_use_replica_and_writes_use_primary(self):
+        user = self.create_user()
+        self.assertEqual(user._state.db, "default")
+
+        with routing_scope():
+            self.assertFalse(CustomUser.objects.filter(email=user.email).exists())
+            with use_primary():
+                self.assertTrue(CustomUser.objects.filter(email=user.email).exists())
+
+    def test_write_pins_reads_in_same_scope(self):
+        with routing_scope():
+            user = CustomUser.objects.create_user(
+                email="ada@example.com", password=STRONG_PASSWORD
+            )
+            self.assertEqual(CustomUser.objects.get(email=user.email), user)
+
+    def test_verify_right_after_register_reads_primary(self):
+        # Register and verify served by two workers, each with its own cache
+        worker_cache = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        with override_settings(CACHES={"default": {**worker_cache, "LOCATION": "1"}}):
+            response = self.client.post(
+                "/api/auth/register/",
+                {"email": "ada@example.com", "password": STRONG_PASSWORD},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+
+        user_id = response.data["userId"]
+        code = CustomUser.objects.using("default").get(id=user_id).otp_code
+        with override_settings(CACHES={"default": {**worker_cache, "LOCATION": "2"}}):
+            response = self.client.post(
+                "/api/auth/verify/", {"user_id": user_id, "code": code}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # Once the sticky window is gone, reads are back on the replica
+        later = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        with mock.patch("django.core.signing.time.time", return_value=later):
+            response = self.client.post(
+                "/api/auth/login/",
+                {"email": "ada@example.com", "password": STRONG_PASSWORD},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(USER_SHARDS=SHARD_DBS, PASSWORD_HASHERS=FAST_HASHERS)
+class UserShardingTests(TestCase):
+    databases = set(SHARD_DBS)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def shard_of(self, user):
+        return next(
+            alias
+            for alias in SHARD_DBS
+            if CustomUser.objects.using(alias).filter(id=user.id).exists()
+        )
+
+    def test_users_are_spread_and_found_by_email_and_id(self):
+        users = [
+            CustomUser.objects.create_user(
+                email=f"user{i}@example.com", password=STRONG_PASSWORD
+            )
+            for i in range(30)
+        ]
+
+        self.assertEqual({self.shard_of(u) for u in users}, set(SHARD_DBS))
+        for user in users:
+            shard = shard_for_email(user.email)
+            self.assertEqual(self.shard_of(user), shard)
+            self.assertEqual(shard_for_id(user.id), shard)
+
+            # A single query against the owning shard only
+            with self.assertNumQueries(1, using=shard):
+                self.assertEqual(CustomUser.objects.get(email=user.email), user)
+            with self.assertNumQueries(1, using=shard):
+                self.assertEqual(CustomUser.objects.get(id=user.id), user)
+            with self.assertNumQueries(1, using=shard):
+                self.assertTrue(CustomUser.objects.filter(email=user.email).exists())
+
+    def test_register_verify_login_unchanged(self):
+        response = self.client.post(
+            "/api/auth/register/",
+            {"email": "ada@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        user = CustomUser.objects.get(id=response.data["userId"])
+        self.assertEqual(user._state.db, shard_for_email("ada@example.com"))
+
+        response = self.client.post(
+            "/api/auth/verify/",
+            {"user_id": str(user.id), "code": user.otp_code},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            "/api/auth/login/",
+            {"email": "ada@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebalance_moves_legacy_users(self):
+        # Users created before sharding: random ids, all on "default"
+        legacy = []
+        for i in range(20):
+            user = CustomUser(id=uuid.uuid4(), email=f"old{i}@example.com")
+            user.set_password(STRONG_PASSWORD)
+            user.save(using="default")
+            legacy.append(user)
+        created_at = legacy[0].created_at
+
+        out = io.StringIO()
+        call_command("rebalance_user_shards", batch_size=7, stdout=out)
+
+        self.assertIn("Moved", out.getvalue())
+        for user in legacy:
+            self.assertEqual(self.shard_of(user), shard_for_email(user.email))
+            self.assertEqual(CustomUser.objects.get(email=user.email), user)
+            # Old ids don't carry their bucket but still resolve
+            self.assertEqual(CustomUser.objects.get(id=user.id), user)
+        self.assertEqual(
+            CustomUser.objects.get(email=legacy[0].email).created_at, created_at
+        )
+
+
+class PrecompressedStaticTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        source = tempfile.TemporaryDirectory()
+        static_root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(source.cleanup)
+        cls.addClassCleanup(static_root.cleanup)
+
+        os.makedirs(f"{source.name}/css")
+        with open(f"{source.name}/css/site.css", "w") as f:
+            f.write("body { margin: 0; }\n" * 200)
+        cls.image = settings.BASE_DIR / "static/images/email-header.png"
+        os.makedirs(f"{source.name}/images")
+        with open(cls.image, "rb") as src, open(
+            f"{source.name}/images/email-header.png", "wb"
+        ) as dst:
+            dst.write(src.read())
+
+        cls.static_root = static_root.name
+        cls.enterClassContext(
+            override_settings(
+                STATIC_ROOT=static_root.name,
+                STATICFILES_DIRS=[source.name],
+                STATICFILES_FINDERS=[
+                    "django.contrib.staticfiles.finders.FileSystemFinder"
+                ],
+            )
+        )
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+        with open(f"{static_root.name}/staticfiles.json") as f:
+            cls.hashed_css = json.load(f)["paths"]["css/site.css"]
+
+    def test_serves_best_precompressed_variant_with_immutable_caching(self):
+        url = f"/static/{self.hashed_css}"
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        css = gzip.decompress(b"".join(response.streaming_content))
+        self.assertTrue(css.startswith(b"body { margin: 0; }"))
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_unhashed_names_must_revalidate(self):
+        response = self.client.get("/static/css/site.css")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("must-revalidate", response["Cache-Control"])
+
+    def test_images_are_optimised_and_not_compressed(self):
+        collected = f"{self.static_root}/images/email-header.png"
+
+        self.assertLessEqual(os.path.getsize(collected), os.path.getsize(self.image))
+        self.assertFalse(os.path.exists(collected + ".gz"))
+
+    @skipIf(staticfiles.Image is None, "Pillow isn't installed")
+    def test_image_optimisation_keeps_profile_and_metadata(self):
+        from PIL import Image, ImageCms
+
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        image = Image.new("RGB", (64, 64), "white")
+
+        jpeg = io.BytesIO()
+        image.save(jpeg, "JPEG", quality=95, icc_profile=icc, exif=exif)
+        self.assertEqual(staticfiles.optimise_image("photo.jpg", jpeg.getvalue()), jpeg.getvalue())
+
+        png = io.BytesIO()
+        image.save(png, "PNG", icc_profile=icc, exif=exif)
+        optimised = staticfiles.optimise_image("logo.png", png.getvalue())
+        self.assertLess(len(optimised), len(png.getvalue()))
+        with Image.open(io.BytesIO(optimised)) as result:
+            self.assertEqual(result.info["icc_profile"], icc)
+            self.assertEqual(result.getexif()[0x010F], "Camera maker")
+
+    def test_assets_are_served_inline(self):
+        response = self.client.get(f"/static/{self.hashed_css}")
+        self.assertFalse(response.has_header("Content-Disposition"))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class MeEndpointTests(TestCase):
+    databases = {"default", REPLICA_DB}
+    url = "/api/auth/me/"
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email="ada@example.com",
+            password=STRONG_PASSWORD,
+            first_name="Ada",
+            is_verified=True,
+        )
+        self.client = APIClient()
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_get_returns_user_with_etag(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["email"], "ada@example.com")
+        self.assertTrue(response["ETag"].startswith('"'))
+
+    def test_if_none_match_returns_304_without_serializing(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with mock.patch.object(MeSerializer, "to_representation") as serialize:
+            # Only the JWT user load touches the database
+            with self.assertNumQueries(1):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+            # Cached rendering is reused for plain GETs too
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            serialize.assert_not_called()
+
+    def test_save_invalidates_cache_and_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.user.first_name = "Augusta"
+        self.user.save(update_fields=["first_name", "updated_at"])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["user"]["first_name"], "Augusta")
+
+    def test_patch_writes_only_changed_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                self.url,
+                {"first_name": "Ada", "last_name": "Lovelace", "email": "x@y.com"},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        update = queries.captured_queries[-1]["sql"]
+        self.assertTrue(update.startswith("UPDATE"))
+        self.assertIn('"last_name"', update)
+        self.assertNotIn('"first_name"', update)
+        self.assertNotIn('"email"', update)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_name, "Lovelace")
+        self.assertEqual(self.user.email, "ada@example.com")
+        self.assertEqual(response["ETag"], self.client.get(self.url)["ETag"])
+
+    def test_patch_with_stale_if_match_is_rejected(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.client.patch(self.url, {"first_name": "Augusta"}, format="json")
+
+        response = self.client.patch(
+            self.url, {"last_name": "King"}, format="json", HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, 412)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_name, "")
+
+        fresh = self.client.get(self.url)["ETag"]
+        response = self.client.patch(
+            self.url, {"last_name": "King"}, format="json", HTTP_IF_MATCH=fresh
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_patch_without_if_match_applies_to_a_stale_user(self):
+        # The replica still has the row from before the next write
+        CustomUser.objects.get(pk=self.user.pk).save(using=REPLICA_DB)
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            first_name="Augusta", updated_at=timezone.now()
+        )
+
+        with override_settings(DATABASE_REPLICAS=[REPLICA_DB]):
+            response = self.client.patch(
+                self.url, {"first_name": "Ada", "last_name": "King"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.last_name), ("Ada", "King"))
+        self.assertEqual(response["ETag"], self.client.get(self.url)["ETag"])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AuditLogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.directory = self.enterContext(
+            tempfile.TemporaryDirectory(prefix="audit-test-")
+        )
+        self.enterContext(
+            override_settings(
+                AUDIT_LOG={"DIRECTORY": self.directory, "FLUSH_INTERVAL": None}
+            )
+        )
+
+    def read_events(self):
+        audit.get_audit_log().flush()
+        return list(audit.JsonlSink.read(self.directory))
+
+    def test_auth_flow_is_audited(self):
+        response = self.client.post(
+            "/api/auth/register/",
+            {"email": "ada@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        user_id = response.data["userId"]
+        self.client.post(
+            "/api/auth/verify/", {"user_id": user_id, "code": "000000"}, format="json"
+        )
+        code = CustomUser.objects.get(id=user_id).otp_code
+        self.client.post(
+            "/api/auth/verify/", {"user_id": user_id, "code": code}, format="json"
+        )
+        self.client.post(
+            "/api/auth/login/",
+            {"email": "ada@example.com", "password": "Wrong!Pass1"},
+            format="json",
+        )
+        self.client.post(
+            "/api/auth/login/",
+            {"email": "ada@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+
+        events = self.read_events()
+        self.assertEqual(
+            [e["event"] for e in events],
+            [
+                "otp_sent",
+                "register",
+                "verify_failed",
+                "verify_succeeded",
+                "login_failed",
+                "login",
+            ],
+        )
+        self.assertTrue(all(e["user_id"] == user_id for e in events))
+        self.assertEqual(events[4]["data"]["reason"], "bad_password")
+        self.assertEqual(events[-1]["ip"], "127.0.0.1")
+
+    def test_logout_is_found_by_user_id(self):
+        user = CustomUser.objects.create_user(
+            email="ada@example.com", password=STRONG_PASSWORD, is_verified=True
+        )
+        refresh = RefreshToken.for_user(user)
+        # token_blacklist isn't in INSTALLED_APPS here
+        with mock.patch.object(RefreshToken, "blacklist", create=True):
+            response = self.client.post(
+                "/api/auth/logout/", {"refreshToken": str(refresh)}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        audit.get_audit_log().flush()
+
+        out = io.StringIO()
+        call_command("audit_log", user_id=str(user.pk), json=True, stdout=out)
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([e["event"] for e in events], ["logout"])
+        self.assertEqual(events[0]["data"], {"user_agent": ""})
+
+    def test_no_writes_until_batch_fills(self):
+        with override_settings(
+            AUDIT_LOG={
+                "DIRECTORY": self.directory,
+                "FLUSH_INTERVAL": None,
+                "BATCH_SIZE": 3,
+            }
+        ):
+            log = audit.get_audit_log()
+            audit.record("login", email="a@example.com")
+            audit.record("login", email="b@example.com")
+            self.assertEqual(log.pending(), 2)
+            self.assertEqual(list(audit.JsonlSink.read(self.directory)), [])
+
+            audit.record("login", email="c@example.com")
+            self.assertEqual(log.pending(), 0)
+            self.assertEqual(len(list(audit.JsonlSink.read(self.directory))), 3)
+
+    def test_segments_rotate_and_read_back_in_order(self):
+        with override_settings(
+            AUDIT_LOG={
+                "DIRECTORY": self.directory,
+                "FLUSH_INTERVAL": None,
+                "BATCH_SIZE": 5,
+                "SEGMENT_MAX_BYTES": 1024,
+            }
+        ):
+            for i in range(50):
+                audit.record("login", email=f"user{i}@example.com")
+            audit.get_audit_log().flush()
+
+        self.assertGreater(len(os.listdir(self.directory)), 1)
+        emails = [e["email"] for e in audit.JsonlSink.read(self.directory)]
+        self.assertEqual(emails, [f"user{i}@example.com" for i in range(50)])
+
+    def test_slow_sink_applies_bounded_backpressure(self):
+        release = threading.Event()
+        written = []
+
+        class SlowSink:
+            def write(self, events):
+                release.wait(5)
+                written.extend(events)
+
+            def close(self):
+                pass
+
+        log = audit.AuditLog(
+            SlowSink(),
+            batch_size=2,
+            flush_interval=0.01,
+            max_pending=4,
+            block_timeout=0.02,
+        )
+        self.addCleanup(log.close)
+        self.addCleanup(release.set)
+
+        log.record({"n": 0})
+        log.record({"n": 1})  # batch full: flusher takes it and blocks
+        time.sleep(0.1)
+        accepted = [log.record({"n": n}) for n in range(2, 8)]
+
+        self.assertEqual(accepted, [True] * 4 + [False] * 2)
+        self.assertEqual(log.dropped, 2)
+
+        release.set()
+        log.flush()
+        self.assertEqual(sorted(e["n"] for e in written), list(range(6)))
+
+    def test_sink_failures_are_logged_and_counted(self):
+        class BrokenSink:
+            def write(self, events):
+                raise OSError("No space left on device")
+
+            def close(self):
+                pass
+
+        log = audit.AuditLog(
+            BrokenSink(),
+            batch_size=10,
+            flush_interval=None,
+            max_pending=10,
+            block_timeout=0,
+        )
+        log.record({"n": 0})
+        with self.assertLogs("authentication.audit", "ERROR") as logs:
+            self.assertEqual(log.flush(), 0)
+
+        self.assertIn("Failed to write 1 audit events", logs.output[0])
+        self.assertIn("No space left on device", logs.output[0])
+        self.assertEqual(log.dropped, 1)
+
+    def test_database_sink_and_query_command(self):
+        with override_settings(
+            AUDIT_LOG={"SINK": "database", "FLUSH_INTERVAL": None, "BATCH_SIZE": 100}
+        ):
+            for reason in ["unknown_email", "bad_password"]:
+                audit.record("login_failed", email="ada@example.com", reason=reason)
+            audit.record("login", email="ada@example.com")
+
+            with self.assertNumQueries(1):
+                audit.get_audit_log().flush()
+            self.assertEqual(AuditEvent.objects.count(), 3)
+
+            out = io.StringIO()
+            call_command("audit_log", event="login_failed", since="1h", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("reason=bad_password", lines[-1])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class QueryBudgetTests(TestCase):
+    databases = {"default", REPLICA_DB}
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_every_auth_view_declares_a_budget(self):
+        from django.urls import get_resolver
+
+        for pattern in get_resolver("authentication.urls").url_patterns:
+            for view in getattr(pattern, "url_patterns", [pattern]):
+                view_class = getattr(view.callback, "cls", None)
+                if view_class is None or view_class.__module__ != "authentication.views":
+                    continue
+                self.assertIsNotNone(
+                    getattr(view_class, "query_budget", None), view_class.__name__
+                )
+
+    def test_register_and_verify_stay_within_budget(self):
+        with assert_max_queries(4, "register"):
+            response = self.client.post(
+                "/api/auth/register/",
+                {"email": "ada@example.com", "password": STRONG_PASSWORD},
+                format="json",
+            )
+        user = CustomUser.objects.get(id=response.data["userId"])
+
+        with assert_max_queries(3, "verify"):
+            response = self.client.post(
+                "/api/auth/verify/",
+                {"user_id": str(user.id), "code": user.otp_code},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_over_budget_request_raises(self):
+        from .views import LoginViewSet
+
+        with mock.patch.object(LoginViewSet, "query_budget", 0):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "budget is 0"):
+                self.client.post(
+                    "/api/auth/login/",
+                    {"email": "ada@example.com", "password": STRONG_PASSWORD},
+                    format="json",
+                )
+
+    def test_repeated_statements_are_flagged(self):
+        emails = [f"user{i}@example.com" for i in range(3)]
+        with count_queries() as counter:
+            for email in emails:
+                CustomUser.objects.filter(email=email).exists()
+            CustomUser.objects.filter(email=emails[0]).exists()
+
+        self.assertEqual(counter.count, 4)
+        (((alias, shape), times),) = counter.repeated(3).items()
+        self.assertEqual((alias, times), ("default", 4))
+        self.assertIn("authentication_customuser", shape)
+        self.assertEqual(list(counter.duplicates().values()), [2])
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA_DB])
+    def test_same_statement_on_other_databases_is_not_a_repeat(self):
+        with count_queries() as counter:
+            for alias in ("default", REPLICA_DB):
+                with connections[alias].cursor() as cursor:
+                    cursor.execute("SELECT 1")
+        self.assertEqual(counter.count, 2)
+        self.assertEqual(counter.duplicates(), {})
+
+        # /readyz pings every database once the worker is warm
+        warmup.warm_up()
+        self.addCleanup(warmup.reset_warm_up)
+        self.assertEqual(self.client.get("/readyz").status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ResendOTPTests(TestCase):
+    url = "/api/auth/verify/resend/"
+
+    def setUp(self):
+        cache.clear()
+        OTP_RESEND_STATS.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email="ada@example.com", password=STRONG_PASSWORD
+        )
+        self.user.generate_otp()  # saved, but not emailed yet
+
+    def resend(self):
+        return self.client.post(self.url, {"user_id": str(self.user.id)}, format="json")
+
+    def test_reuses_valid_code(self):
+        code = self.user.otp_code
+
+        # SELECT user, UPDATE claiming the send; the code itself is kept
+        with self.assertNumQueries(2):
+            response = self.resend()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(code, mail.outbox[0].body)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.otp_code, code)
+
+    def test_generates_new_code_when_current_is_about_to_expire(self):
+        CustomUser.objects.filter(id=self.user.id).update(
+            otp_expiry=timezone.now() + timedelta(seconds=30)
+        )
+        response = self.resend()
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIn(self.user.otp_code, mail.outbox[0].body)
+        self.assertGreater(self.user.otp_expiry, timezone.now() + timedelta(minutes=9))
+        self.assertEqual(otp_resend_stats()["sent"], 1)
+
+    def test_resends_are_spaced_per_user(self):
+        self.assertEqual(self.resend().status_code, 200)
+        response = self.resend()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 60)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(otp_resend_stats()["suppressed"], 1)
+
+    def test_spacing_holds_across_workers(self):
+        # Two worker processes, each with its own local cache
+        worker_cache = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        with override_settings(CACHES={"default": {**worker_cache, "LOCATION": "1"}}):
+            self.assertEqual(self.resend().status_code, 200)
+        with override_settings(CACHES={"default": {**worker_cache, "LOCATION": "2"}}):
+            response = self.resend()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_send_can_be_retried_straight_away(self):
+        with mock.patch("authentication.utils.send_user_email", return_value=False):
+            self.assertEqual(self.resend().status_code, 400)
+
+        self.assertEqual(self.resend().status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_verified_user_is_rejected(self):
+        CustomUser.objects.filter(id=self.user.id).update(is_verified=True)
+
+        self.assertEqual(self.resend().status_code, 400)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_concurrent_resends_collapse_into_one_send(self):
+        release = threading.Event()
+        sent_codes, results = [], []
+
+        def slow_send(user, otp, minutes=10):
+            sent_codes.append(otp)
+            release.wait(5)
+            return True
+
+        # Threads can't write inside the test's transaction; the claim
+        # itself is covered by test_spacing_holds_across_workers
+        with mock.patch(
+            "authentication.utils._claim_resend_slot", return_value=True
+        ), mock.patch("authentication.utils.send_otp_email", side_effect=slow_send):
+            threads = [
+                threading.Thread(target=lambda: results.append(resend_otp(self.user)))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)  # leader is sending, the rest are waiting on it
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sent_codes, [self.user.otp_code])
+        self.assertEqual({r.outcome for r in results}, {"reused"})
+        self.assertEqual(sum(r.coalesced for r in results), 4)
+        self.assertEqual(otp_resend_stats()["suppressed"], 4)
+
+    def test_stats_are_served_to_staff_only(self):
+        self.assertEqual(self.resend().status_code, 200)
+        self.assertEqual(self.resend().status_code, 429)
+
+        response = self.client.get("/metrics/otp-resend")
+        self.assertEqual(response.status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get("/metrics/otp-resend").status_code, 403)
+
+        self.user.is_staff = True
+        response = self.client.get("/metrics/otp-resend")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), otp_resend_stats())
+        self.assertEqual(response.json()["suppressed"], 1)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class PurgeUnverifiedUsersTests(TestCase):
+    def make_user(self, email, age, verified=False):
+        user = CustomUser.objects.create_user(
+            email=email, password=STRONG_PASSWORD, is_verified=verified
+        )
+        CustomUser.objects.filter(id=user.id).update(
+            created_at=timezone.now() - age
+        )
+        return user
+
+    def setUp(self):
+        self.stale = [
+            self.make_user(f"bot{i}@example.com", timedelta(days=8 + i))
+            for i in range(5)
+        ]
+        self.verified = self.make_user(
+            "ada@example.com", timedelta(days=30), verified=True
+        )
+        self.recent = self.make_user("new@example.com", timedelta(hours=1))
+
+    def purge(self, **options):
+        out = io.StringIO()
+        call_command(
+            "purge_unverified_users", batch_size=2, sleep=0, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_purges_only_stale_unverified_users_in_batches(self):
+        archive = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        self.addCleanup(os.unlink, archive.name)
+
+        output = self.purge(archive=archive.name)
+
+        self.assertIn("Purged 5 unverified users", output)
+        self.assertIn("rows/s", output)
+        self.assertEqual(
+            set(CustomUser.objects.values_list("email", flat=True)),
+            {"ada@example.com", "new@example.com"},
+        )
+        with open(archive.name) as f:
+            archived = [json.loads(line) for line in f]
+        self.assertEqual(
+            sorted(a["email"] for a in archived), sorted(u.email for u in self.stale)
+        )
+        self.assertNotIn("password", archived[0])
+
+    def test_dry_run_and_limits(self):
+        self.assertIn("Would purge 5", self.purge(dry_run=True))
+        self.assertEqual(CustomUser.objects.count(), 7)
+
+        self.assertIn("Purged 3", self.purge(max_rows=3))
+        self.assertIn("Purged 0", self.purge(older_than="30d"))
+        self.assertIn("Purged 2", self.purge(older_than="48h"))
+
+    def test_uses_the_unverified_created_index(self):
+        stale = CustomUser.objects.filter(
+            is_verified=False, created_at__lt=timezone.now()
+        ).order_by("created_at", "id")
+        sql, params = stale.values("id").query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+
+        self.assertIn("user_unverified_created_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class WarmUpProbeTests(TestCase):
+    def setUp(self):
+        warmup.reset_warm_up()
+        self.addCleanup(warmup.reset_warm_up)
+        self.client = APIClient()
+
+    def test_healthz_is_cheap_and_always_live(self):
+        with assert_max_queries(0) as counter:
+            response = self.client.get("/healthz")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(counter.count, 0)
+        self.assertFalse(warmup.is_warm())
+
+    def test_warm_up_runs_every_step_once_per_process(self):
+        state = warmup.warm_up()
+
+        self.assertTrue(state["warm"])
+        self.assertEqual(state["errors"], {})
+        self.assertEqual(set(state["steps"]), {name for name, _ in warmup.STEPS})
+        with mock.patch.object(warmup, "ping_databases") as ping:
+            warmup.warm_up()
+        ping.assert_not_called()
+
+    def test_readyz_warms_the_worker_then_checks_the_database(self):
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ready")
+        self.assertTrue(warmup.is_warm())
+
+        with mock.patch.object(
+            warmup, "ping_databases", side_effect=OSError("database is locked")
+        ):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("database is locked", response.json()["errors"]["database"])
+
+    def test_warm_up_keeps_connections_until_the_process_forks(self):
+        idle, in_transaction = mock.Mock(in_atomic_block=False), mock.Mock(
+            in_atomic_block=True
+        )
+        self.enterContext(mock.patch.object(warmup, "_fork_hook_registered", False))
+        register_at_fork = self.enterContext(
+            mock.patch.object(warmup.os, "register_at_fork")
+        )
+        with mock.patch.object(warmup, "ping_databases"), mock.patch.object(
+            warmup.connections, "all", return_value=[idle, in_transaction]
+        ):
+            warmup.warm_up()
+            idle.close.assert_not_called()
+
+            # A preloading master forking its workers
+            register_at_fork.call_args.kwargs["before"]()
+        idle.close.assert_called_once_with()
+        in_transaction.close.assert_not_called()
+
+    def test_failed_warm_up_is_not_ready_until_retried(self):
+        with mock.patch.object(
+            warmup, "ping_databases", side_effect=OSError("unable to open database")
+        ):
+            with self.assertLogs("authentication.warmup", "ERROR") as logs:
+                self.assertFalse(warmup.warm_up()["warm"])
+            self.assertIn("Warm-up step database failed", logs.output[0])
+            self.assertIn("unable to open database", logs.output[0])  # traceback
+            with self.assertLogs("authentication.warmup", "ERROR"):
+                self.assertEqual(self.client.get("/readyz").status_code, 503)
+
+        self.assertEqual(self.client.get("/readyz").status_code, 200)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+)
+class CustomUserAdminTests(TestCase):
+    USERS = 50_000
+    URL = "/admin/authentication/customuser/"
+    # Per changelist request, ~10x what it takes here so a loaded CI box
+    # doesn't flake. The query count/shape checks catch regressions too
+    # small to show at this table size.
+    LATENCY_BUDGET = 1.0  # seconds
+
+    @classmethod
+    def setUpTestData(cls):
+        # Generated in SQL: going through the ORM would dominate the suite.
+        # Signups are spread over time so the ordering isn't all ties.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+                INSERT INTO authentication_customuser (
+                    id, email, email_key, password, first_name, last_name, is_verified,
+                    is_active, is_staff, is_superuser, created_at, updated_at
+                )
+                SELECT lower(hex(randomblob(16))), printf('user%%05d@example.com', i),
+                       printf('user%%05d@example.com', i), '!', '', '', i %% 3 = 0, 1, 0, 0,
+                       datetime('2026-01-01', '+' || (i %% 5000) || ' minutes'),
+                       datetime('2026-01-01')
+                FROM n
+                """,
+                [cls.USERS - 1],
+            )
+            cursor.execute("ANALYZE")
+        cls.admin = CustomUser.objects.create_superuser(
+            email="admin@example.com", password=STRONG_PASSWORD
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def get(self, query=""):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(self.URL + query)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(
+            elapsed, self.LATENCY_BUDGET, f"changelist{query} took {elapsed:.2f}s"
+        )
+        queries = [q["sql"] for q in queries]
+        # At most: session, request.user, count, page keys, page rows
+        self.assertLessEqual(len(queries), 5, queries)
+        return response, queries
+
+    def emails(self, response):
+        return [u.email for u in response.context["cl"].result_list]
+
+    def test_changelist_uses_estimated_count_and_minimal_columns(self):
+        response, queries = self.get()
+
+        cl = response.context["cl"]
+        self.assertGreaterEqual(cl.result_count, self.USERS)
+        self.assertEqual(len(cl.result_list), 50)
+        # (The session's request.user load is the only full-row fetch)
+        user_queries = [q for q in queries if "authentication_customuser" in q][1:]
+        self.assertFalse(any("COUNT(*)" in q for q in user_queries), user_queries)
+        self.assertFalse(any("otp_code" in q for q in user_queries), user_queries)
+
+    def test_next_page_seeks_past_the_previous_one(self):
+        first, _ = self.get()
+        second, queries = self.get("?p=2")
+        self.assertFalse(any("OFFSET" in q for q in queries), queries)
+
+        expected = list(
+            CustomUser.objects.order_by("-created_at", "-id").values_list(
+                "email", flat=True
+            )[:100]
+        )
+        self.assertEqual(self.emails(first) + self.emails(second), expected)
+
+        # Jumping straight to a page falls back to a pk-only OFFSET
+        cache.clear()
+        jumped, queries = self.get("?p=2")
+        self.assertEqual(self.emails(jumped), expected[50:])
+        self.assertTrue(any("OFFSET" in q for q in queries))
+
+    def test_deep_page_and_filtered_list_stay_cheap(self):
+        response, queries = self.get("?p=900")
+        self.assertEqual(len(self.emails(response)), 50)
+        # The OFFSET walks the primary key only; full rows are fetched by pk
+        (offset,) = [q for q in queries if "OFFSET" in q]
+        self.assertTrue(
+            offset.startswith('SELECT "authentication_customuser"."id" FROM'), offset
+        )
+
+        response, queries = self.get("?is_verified__exact=1")
+        self.assertEqual(
+            response.context["cl"].result_count,
+            CustomUser.objects.filter(is_verified=True).count(),
+        )
+        (count,) = [q for q in queries if "COUNT(*)" in q]
+        self.assertIn("LIMIT 100000", count)
+
+    def test_row_estimate_ignores_partial_index_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT idx, stat FROM sqlite_stat1 WHERE tbl = %s",
+                [CustomUser._meta.db_table],
+            )
+            stats = sorted(cursor.fetchall(), key=lambda row: int(row[1].split()[0]))
+            # Smallest (the partial user_unverified_created_idx) first
+            cursor.execute("DELETE FROM sqlite_stat1")
+            for idx, stat in stats:
+                cursor.execute(
+                    "INSERT INTO sqlite_stat1 VALUES (%s, %s, %s)",
+                    [CustomUser._meta.db_table, idx, stat],
+                )
+        self.assertEqual(stats[0][0], "user_unverified_created_idx")
+        self.assertEqual(estimate_row_count(CustomUser, "default"), self.USERS)
+
+    def test_search_is_an_email_prefix_range(self):
+        response, queries = self.get("?q=User1999")
+
+        self.assertEqual(
+            sorted(self.emails(response)),
+            [f"user1999{i}@example.com" for i in range(10)],
+        )
+        search = next(q for q in queries if ">=" in q)
+        self.assertNotIn("LIKE", search)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM authentication_customuser "
+                "WHERE email_key >= %s AND email_key < %s",
+                ["user1999", "user1999\uffff"],
+            )
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("SEARCH", plan)
+
+        user = CustomUser.objects.get(email="user00042@example.com")
+        response, _ = self.get(f"?q={user.id}")
+        self.assertEqual(self.emails(response), [user.email])
+
+    def test_add_user_gets_a_shard_bucketed_id(self):
+        response = self.client.post(
+            "/admin/authentication/customuser/add/",
+            {
+                "email": "new@example.com",
+                "password1": STRONG_PASSWORD,
+                "password2": STRONG_PASSWORD,
+                "usable_password": "true",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        user = CustomUser.objects.get(email="new@example.com")
+        self.assertEqual(shard_for_id(user.id, SHARD_DBS), shard_for_email(user.email, SHARD_DBS))
+        self.assertTrue(user.check_password(STRONG_PASSWORD))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class CaseInsensitiveEmailTests(TestCase):
+    databases = set(SHARD_DBS)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email="Ada.Lovelace@Example.COM", password=STRONG_PASSWORD, is_verified=True
+        )
+
+    def test_email_key_is_the_lowercased_email(self):
+        self.assertEqual(self.user.email, "Ada.Lovelace@example.com")
+        self.assertEqual(self.user.email_key, "ada.lovelace@example.com")
+
+        self.user.email = "ADA@example.com"
+        self.user.save(update_fields=["email"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email_key, "ada@example.com")
+
+    def test_login_in_any_casing_is_one_index_seek(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/auth/login/",
+                {"email": "ADA.LOVELACE@example.com", "password": STRONG_PASSWORD},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+        lookup = queries[0]["sql"]
+        self.assertIn('"email_key" = ', lookup)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + lookup)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("USING INDEX", plan)
+
+    def test_other_casings_count_as_the_same_account(self):
+        response = self.client.post(
+            "/api/auth/register/",
+            {"email": "ada.lovelace@EXAMPLE.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already registered", str(response.data))
+
+        with self.assertRaises(ValidationError):
+            CustomUser(email="ADA.LOVELACE@example.com").clean()
+        self.assertEqual(
+            CustomUser.objects.get_by_natural_key("ada.lovelace@example.com"), self.user
+        )
+
+    @override_settings(USER_SHARDS=SHARD_DBS)
+    def test_case_insensitive_lookup_finds_the_owning_shard(self):
+        user = CustomUser.objects.create_user(
+            email="Grace@Example.com", password=STRONG_PASSWORD
+        )
+        self.assertEqual(CustomUser.objects.with_email("GRACE@example.com").get(), user)
+        self.assertEqual(
+            CustomUser.objects.with_email("grace@example.com").db,
+            shard_for_email("grace@example.com"),
+        )
+
+
+class WebhookStub:
+    """Local HTTP endpoint recording signed POSTs; fails the first `fail` ones"""
+
+    def __init__(self, fail=0, delay=0):
+        self.requests = []
+        self.fail = fail
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.in_flight -= 1
+                    stub.requests.append((dict(self.headers), body))
+                    failing = stub.fail > 0
+                    stub.fail -= failing
+                self.send_response(500 if failing else 204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hooks"
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        ).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def events(self):
+        return [e for _, body in self.requests for e in json.loads(body)["events"]]
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class UserLifecycleEventTests(TestCase):
+    databases = set(SHARD_DBS)
+    SECRET = "whsec-test"
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.stub = WebhookStub()
+        self.addCleanup(self.stub.close)
+
+    def dispatcher(self, **conf):
+        endpoint = {"URL": self.stub.url, "SECRET": self.SECRET}
+        endpoint.update(conf.pop("endpoint", {}))
+        return Dispatcher(
+            {**get_webhook_settings(), "ENDPOINTS": {"stub": endpoint}, **conf}
+        )
+
+    def make_users(self, n):
+        users = []
+        start = CustomUser.objects.count()
+        for i in range(start, start + n):
+            user = CustomUser.objects.create_user(
+                email=f"user{i}@example.com", password=STRONG_PASSWORD
+            )
+            publish("user.registered", user)
+            users.append(user)
+        return users
+
+    @override_settings(USER_SHARDS=SHARD_DBS)
+    def test_admin_add_commits_user_and_event_on_the_users_shard(self):
+        emails = [f"shard{i}@example.com" for i in range(100)]
+        email = next(e for e in emails if shard_for_email(e, SHARD_DBS) != "default")
+        shard = shard_for_email(email, SHARD_DBS)
+        # The admin (and django_admin_log, which references it) on "default"
+        admin_email = next(
+            e for e in emails if shard_for_email(e, SHARD_DBS) == "default"
+        )
+        self.client.force_login(
+            CustomUser.objects.create_superuser(
+                email=admin_email, password=STRONG_PASSWORD
+            )
+        )
+        form = {
+            "email": email,
+            "password1": STRONG_PASSWORD,
+            "password2": STRONG_PASSWORD,
+            "usable_password": "true",
+        }
+        url = "/admin/authentication/customuser/add/"
+
+        with mock.patch.object(
+            events, "publish", side_effect=RuntimeError("outbox down")
+        ), self.assertRaises(RuntimeError):
+            self.client.post(url, form)
+        self.assertFalse(CustomUser.objects.using(shard).filter(email=email).exists())
+
+        self.assertEqual(self.client.post(url, form).status_code, 302)
+        user = CustomUser.objects.using(shard).get(email=email)
+        self.assertTrue(
+            OutboxEvent.objects.using(shard)
+            .filter(event="user.registered", user_id=user.id)
+            .exists()
+        )
+
+    def test_register_verify_and_deactivate_write_outbox_events(self):
+        response = self.client.post(
+            "/api/auth/register/",
+            {"email": "ada@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        user = CustomUser.objects.get(id=response.data["userId"])
+        response = self.client.post(
+            "/api/auth/verify/",
+            {"user_id": str(user.id), "code": user.otp_code},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        user.deactivate()
+
+        events = list(OutboxEvent.objects.order_by("id"))
+        self.assertEqual(
+            [e.event for e in events],
+            ["user.registered", "user.verified", "user.deactivated"],
+        )
+        self.assertEqual({e.user_id for e in events}, {user.id})
+        self.assertTrue(events[1].payload["user"]["is_verified"])
+        self.assertFalse(events[2].payload["user"]["is_active"])
+
+    def test_event_is_rolled_back_with_the_change(self):
+        user = CustomUser.objects.create_user(
+            email="ada@example.com", password=STRONG_PASSWORD
+        )
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                user.deactivate()
+                raise RuntimeError("crash before commit")
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertTrue(CustomUser.objects.get(id=user.id).is_active)
+
+    def test_overlapping_runs_never_claim_the_same_delivery(self):
+        self.make_users(4)
+        dispatcher = self.dispatcher()
+        dispatcher.fan_out("default")
+        taken = list(WebhookDelivery.objects.order_by("id")[:2])
+        other_run = []
+
+        def other_run_leases_first(execute, sql, params, many, context):
+            # Between this run's SELECT and its lease UPDATE
+            if sql.startswith("UPDATE") and not other_run:
+                other_run.append(True)
+                WebhookDelivery.objects.filter(id__in=[d.id for d in taken]).update(
+                    next_attempt_at=timezone.now() + timedelta(minutes=1)
+                )
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(other_run_leases_first):
+            stats = dispatcher.deliver("default")
+
+        self.assertEqual(stats["delivered"], 2)
+        delivered = {e["id"] for e in self.stub.events()}
+        self.assertEqual(len(delivered), 2)
+        for delivery in taken:
+            self.assertNotIn(delivery.event.payload["id"], delivered)
+            delivery.refresh_from_db()
+            self.assertEqual(
+                (delivery.status, delivery.attempts), (WebhookDelivery.PENDING, 0)
+            )
+
+    def test_delivers_signed_batches_within_the_concurrency_limit(self):
+        self.stub.delay = 0.05
+        self.make_users(25)
+
+        stats = self.dispatcher(
+            BATCH_SIZE=5, endpoint={"MAX_CONCURRENCY": 2}
+        ).run_once()
+
+        # Two batches of five in flight at once, the rest on later runs
+        self.assertEqual(stats["delivered"], 10)
+        self.assertEqual(self.stub.max_in_flight, 2)
+        for headers, body in self.stub.requests:
+            self.assertTrue(
+                verify_signature(self.SECRET, body, headers[SIGNATURE_HEADER])
+            )
+            self.assertFalse(
+                verify_signature("wrong", body, headers[SIGNATURE_HEADER])
+            )
+
+        dispatcher = self.dispatcher(BATCH_SIZE=5, endpoint={"MAX_CONCURRENCY": 2})
+        while dispatcher.run_once()["delivered"]:
+            pass
+        self.assertEqual(len(self.stub.events()), 25)
+        self.assertEqual(len({e["id"] for e in self.stub.events()}), 25)
+        self.assertFalse(
+            WebhookDelivery.objects.exclude(status=WebhookDelivery.DELIVERED).exists()
+        )
+
+    def test_failed_batches_are_retried_with_backoff_then_given_up(self):
+        self.stub.fail = 1
+        self.make_users(3)
+        dispatcher = self.dispatcher(MAX_ATTEMPTS=3)
+
+        self.assertEqual(dispatcher.run_once()["retrying"], 3)
+        delivery = WebhookDelivery.objects.first()
+        self.assertEqual((delivery.attempts, delivery.last_error), (1, "HTTP 500"))
+        self.assertGreater(delivery.next_attempt_at, timezone.now())
+        self.assertEqual(dispatcher.run_once()["delivered"], 0)  # not due yet
+
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatcher.run_once()["delivered"], 3)
+        self.assertEqual(len(self.stub.requests), 2)
+
+        # An endpoint that never answers is given up on after MAX_ATTEMPTS
+        self.stub.fail = 10
+        self.make_users(1)
+        for _ in range(3):
+            dispatcher.run_once()
+            WebhookDelivery.objects.filter(status="pending").update(
+                next_attempt_at=timezone.now()
+            )
+        self.assertEqual(
+            WebhookDelivery.objects.filter(status=WebhookDelivery.FAILED).count(), 1
+        )
+
+    def test_endpoints_only_get_the_events_they_subscribe_to(self):
+        user = self.make_users(1)[0]
+        user.deactivate()
+
+        self.dispatcher(endpoint={"EVENTS": ["user.deactivated"]}).run_once()
+
+        self.assertEqual([e["event"] for e in self.stub.events()], ["user.deactivated"])
+        self.assertFalse(OutboxEvent.objects.filter(fanned_out=False).exists())
+
+    def test_delivered_rows_are_purged_after_retention(self):
+        self.stub.fail = 1
+        self.make_users(3)
+        dispatcher = self.dispatcher(MAX_ATTEMPTS=1)
+        self.assertEqual(dispatcher.run_once()["failed"], 3)
+        self.make_users(2)
+        self.assertEqual(dispatcher.run_once()["delivered"], 2)
+
+        old = timezone.now() - timedelta(days=8)
+        OutboxEvent.objects.update(created_at=old)
+        WebhookDelivery.objects.filter(status=WebhookDelivery.DELIVERED).update(
+            delivered_at=old
+        )
+        # Not yet: the last purge was less than PURGE_INTERVAL ago
+        self.assertEqual(dispatcher.run_once()["purged"], 0)
+
+        self.assertEqual(self.dispatcher().run_once()["purged"], 2)
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        self.assertEqual(
+            set(WebhookDelivery.objects.values_list("status", flat=True)),
+            {WebhookDelivery.FAILED},
+        )
+
+    @override_settings(USER_SHARDS=SHARD_DBS)
+    def test_command_dispatches_only_the_given_databases(self):
+        users = [
+            CustomUser.objects.create_user(
+                email=f"shard{i}@example.com", password=STRONG_PASSWORD
+            )
+            for i in range(12)
+        ]
+        for user in users:
+            publish("user.registered", user)
+        endpoints = {"stub": {"URL": self.stub.url, "SECRET": self.SECRET}}
+
+        with override_settings(WEBHOOKS={"ENDPOINTS": endpoints}):
+            call_command(
+                "dispatch_events", "--database", "shard_test_1", stdout=io.StringIO()
+            )
+
+        delivered = {e["user"]["email"] for e in self.stub.events()}
+        expected = {u.email for u in users if u._state.db == "shard_test_1"}
+        self.assertTrue(expected)
+        self.assertEqual(delivered, expected)
+
+
+class AdmissionPoolTests(SimpleTestCase):
+    def test_admits_queues_then_sheds(self):
+        pool = AdmissionPool("test", concurrency=2, queue=1, timeout=5)
+        held = [pool.acquire(), pool.acquire()]
+        self.assertTrue(all(held))
+
+        waiter_result = []
+        waiter = threading.Thread(target=lambda: waiter_result.append(pool.acquire()))
+        waiter.start()
+        while pool.stats()["queue_depth"] < 1:
+            time.sleep(0.001)
+
+        self.assertIsNone(pool.acquire())  # queue full
+        pool.release(held.pop())
+        waiter.join()
+        self.assertIsNotNone(waiter_result[0])
+
+        stats = pool.stats()
+        self.assertEqual(
+            (stats["active"], stats["admitted"], stats["shed_queue_full"]), (2, 3, 1)
+        )
+        self.assertEqual(stats["max_queue_depth"], 1)
+
+    def test_queued_request_is_shed_after_timeout(self):
+        pool = AdmissionPool("test", concurrency=1, queue=5, timeout=0.01)
+        pool.acquire()
+        self.assertIsNone(pool.acquire())
+        self.assertEqual(pool.stats()["shed_timeout"], 1)
+        self.assertGreaterEqual(pool.retry_after(), 1)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    ADMISSION_CONTROL={
+        "hashing": {"CONCURRENCY": 1, "QUEUE": 0},
+        "tokens": {"CONCURRENCY": 1, "QUEUE": 0},
+    },
+)
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            email="ada@example.com", password=STRONG_PASSWORD, is_verified=True
+        )
+
+    def login(self):
+        return self.client.post(
+            "/api/auth/login/",
+            {"email": "ada@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+
+    def test_saturated_hashing_sheds_login_and_register_but_not_refresh(self):
+        hashing = get_pool("hashing")
+        slot = hashing.acquire()  # a hash in progress on the only slot
+
+        response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        response = self.client.post(
+            "/api/auth/register/",
+            {"email": "new@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(CustomUser.objects.filter(email="new@example.com").exists())
+
+        refresh = RefreshToken.for_user(self.user)
+        response = self.client.post(
+            "/api/auth/refresh/", {"refresh": str(refresh)}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        hashing.release(slot)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_registration_email_is_sent_outside_the_hashing_slot(self):
+        active_while_sending = []
+        admitted = get_pool("hashing").stats()["admitted"]
+
+        def slow_smtp(*args, **kwargs):
+            active_while_sending.append(get_pool("hashing").stats()["active"])
+            return 1
+
+        with mock.patch("authentication.utils.send_mail", side_effect=slow_smtp):
+            response = self.client.post(
+                "/api/auth/register/",
+                {"email": "new@example.com", "password": STRONG_PASSWORD},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(active_while_sending, [0])
+        self.assertEqual(get_pool("hashing").stats()["admitted"], admitted + 1)
+
+    def test_slots_are_released_after_errors(self):
+        response = self.client.post(
+            "/api/auth/login/",
+            {"email": "ada@example.com", "password": "wrong"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(get_pool("hashing").stats()["active"], 0)
+
+    def test_metrics_report_queue_depth_and_shed_counts(self):
+        slot = get_pool("hashing").acquire()
+        self.login()
+        get_pool("hashing").release(slot)
+
+        self.assertEqual(self.client.get("/metrics/admission").status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get("/metrics/admission").status_code, 403)
+        self.user.is_staff = True
+        metrics = self.client.get("/metrics/admission").json()
+        self.assertEqual(set(metrics), {"hashing", "tokens"})
+        self.assertEqual(metrics["hashing"]["shed"], 1)
+        self.assertEqual(metrics["hashing"]["queue_depth"], 0)
+        self.assertEqual(metrics["tokens"]["shed"], 0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class FaultInjectionTests(TestCase):
+    def setUp(self):
+        faults.install()
+        self.addCleanup(faults.uninstall)
+
+    def test_latency_distributions(self):
+        rng = random.Random(7)
+        self.assertEqual(faults.sample_latency(None, rng), 0)
+        self.assertEqual(faults.sample_latency({"MS": 250}, rng), 0.25)
+        for _ in range(100):
+            uniform = {"DISTRIBUTION": "uniform", "MIN_MS": 10, "MAX_MS": 20}
+            self.assertTrue(0.01 <= faults.sample_latency(uniform, rng) <= 0.02)
+            capped = {"DISTRIBUTION": "exponential", "MEAN_MS": 100, "MAX_MS": 150}
+            self.assertLessEqual(faults.sample_latency(capped, rng), 0.15)
+        lognormal = {"DISTRIBUTION": "lognormal", "MEDIAN_MS": 100, "SIGMA": 0.5}
+        samples = sorted(faults.sample_latency(lognormal, rng) for _ in range(999))
+        self.assertAlmostEqual(samples[499], 0.1, delta=0.02)
+        with self.assertRaises(ValueError):
+            faults.sample_latency({"DISTRIBUTION": "pareto"}, rng)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(faults.get_injector())
+        with CaptureQueriesContext(connection):
+            connection.cursor().execute("SELECT 1")
+        self.assertTrue(check_password("x", make_password("x")))
+
+    @override_settings(
+        FAULT_INJECTION={"ENABLED": True, "DB": {"MATCH": r"^SELECT 1$", "ERROR_RATE": 1}}
+    )
+    def test_db_errors_only_hit_matching_sql(self):
+        with self.assertRaisesMessage(OperationalError, "database is locked"):
+            connection.cursor().execute("SELECT 1")
+        connection.cursor().execute("SELECT 2")
+        self.assertEqual(faults.get_injector().stats["db_errors"], 1)
+
+    @override_settings(
+        FAULT_INJECTION={"ENABLED": True, "DB": {"MATCH": r"^SELECT 1$", "ERROR_RATE": 1}}
+    )
+    def test_db_hook_survives_requests_on_new_connections(self):
+        self.addCleanup(warmup.reset_warm_up)
+        result = {}
+
+        def new_worker_thread():
+            try:
+                # Its first query opens the thread's connection inside
+                # QueryBudgetMiddleware's execute_wrapper() block
+                result["status"] = APIClient().get("/readyz").status_code
+                result["wrappers"] = list(connection.execute_wrappers)
+                try:
+                    connection.cursor().execute("SELECT 1")
+                except OperationalError:
+                    result["later_query_failed"] = True
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=new_worker_thread)
+        with self.assertLogs("authentication.warmup", "ERROR"):
+            thread.start()
+            thread.join()
+
+        self.assertEqual(result["status"], 503)
+        self.assertEqual(result["wrappers"], [faults._db_wrapper])
+        self.assertTrue(result.get("later_query_failed"))
+
+    def test_uninstall_restores_the_originals(self):
+        from django.contrib.auth.hashers import get_hasher
+
+        hasher_class = type(get_hasher())
+        self.assertTrue(hasattr(hasher_class.encode, "_fault_target"))
+        self.assertIn(faults._db_wrapper, connection.execute_wrappers)
+        faults.uninstall()
+        self.assertFalse(hasattr(hasher_class.encode, "_fault_target"))
+        self.assertFalse(hasattr(mail.get_connection().send_messages, "_fault_target"))
+        self.assertNotIn(faults._db_wrapper, connection.execute_wrappers)
+
+    @override_settings(
+        FAULT_INJECTION={"ENABLED": True, "HASHER": {"LATENCY": {"MS": 250}}}
+    )
+    def test_hasher_latency(self):
+        with mock.patch("authentication.faults.time.sleep") as sleep:
+            self.assertTrue(check_password("x", make_password("x")))
+        self.assertEqual(sleep.call_args_list, [mock.call(0.25)] * 2)
+
+    @override_settings(FAULT_INJECTION={"ENABLED": True, "EMAIL": {"ERROR_RATE": 1}})
+    def test_smtp_failure_fails_registration(self):
+        cache.clear()
+        response = APIClient().post(
+            "/api/auth/register/",
+            {"email": "new@example.com", "password": STRONG_PASSWORD},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(faults.get_injector().stats["email_errors"], 1)
+
+
+class PasswordIndexTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(self.dir, "breached.idx")
+
+    def build(self, passwords, **kwargs):
+        digests = [password_digest(p) for p in passwords]
+        written = write_password_index(self.path, digests, **kwargs)
+        index = get_password_index(self.path)
+        self.addCleanup(index.close)
+        return written, index, sorted(set(d[: index.width] for d in digests))
+
+    def test_binary_search_hits_and_misses(self):
+        written, index, records = self.build([f"pw{i}" for i in range(101)])
+        self.assertEqual(written, len(index), 101)
+        for record in (records[0], records[50], records[-1]):
+            self.assertIn(record, index)
+        self.assertNotIn(b"\x00" * 20, index)  # before the first record
+        self.assertNotIn(b"\xff" * 20, index)  # after the last one
+        self.assertNotIn(records[0][:-1] + bytes([records[0][-1] + 1]), index)
+        self.assertTrue(index.contains_password("pw7"))
+        self.assertFalse(index.contains_password("pw101"))
+
+    def test_width_truncation(self):
+        written, index, records = self.build(["hunter2", "letmein"], width=6)
+        self.assertEqual(index.width, 6)
+        self.assertEqual(os.path.getsize(self.path), 8 + 6 * written)
+        self.assertTrue(index.contains_password("hunter2"))
+        self.assertIn(password_digest("hunter2")[:6], index)
+
+    def test_chunks_are_merged_and_deduplicated(self):
+        passwords = [f"pw{i % 40}" for i in range(100)]
+        written, index, records = self.build(passwords, chunk_size=7)
+        self.assertEqual(written, 40)
+        with open(self.path, "rb") as f:
+            f.seek(8)
+            body = f.read()
+        self.assertEqual(body, b"".join(records))
+        self.assertEqual(os.listdir(self.dir), ["breached.idx"])  # runs removed
+
+    def test_build_command_parses_hibp_counts(self):
+        source = os.path.join(self.dir, "pwned.txt")
+        with open(source, "w") as f:
+            f.write(f"{hashlib.sha1(b'often').hexdigest().upper()}:120\n")
+            f.write(f"{hashlib.sha1(b'rarely').hexdigest().upper()}:2\n")
+            f.write("plaintext-pw\n\n")
+        out = io.StringIO()
+        call_command(
+            "build_password_index",
+            source,
+            output=self.path,
+            min_count=10,
+            no_django_common=True,
+            stdout=out,
+        )
+        self.assertIn("pwned.txt: 2 entries", out.getvalue())
+        index = get_password_index(self.path)
+        self.addCleanup(index.close)
+        self.assertEqual(len(index), 2)
+        self.assertTrue(index.contains_password("often"))
+        self.assertTrue(index.contains_password("plaintext-pw"))
+        self.assertFalse(index.contains_password("rarely"))
+
+    def test_falls_back_to_common_passwords_without_an_index(self):
+        validator = BreachedPasswordValidator(os.path.join(self.dir, "missing.idx"))
+        with self.assertRaises(ValidationError):
+            validator.validate("password")
+        validator.validate(STRONG_PASSWORD)
+
+    def test_rebuild_is_picked_up(self):
+        validator = BreachedPasswordValidator(self.path)
+        self.build(["first-list"])
+        with self.assertRaises(ValidationError):
+            validator.validate("first-list")
+
+        self.build(["second-list"])
+        validator.validate("first-list")
+        with self.assertRaises(ValidationError):
+            validator.validate("second-list")
+
+    def test_rebuild_by_another_process_is_picked_up(self):
+        validator = BreachedPasswordValidator(self.path)
+        self.build(["first-list"])
+        with self.assertRaises(ValidationError):
+            validator.validate("first-list")
+
+        # As on a live server: build_password_index runs in its own process
+        source = os.path.join(self.dir, "second.txt")
+        with open(source, "w") as f:
+            f.write("second-list\n")
+        subprocess.run(
+            [
+                sys.executable,
+                "manage.py",
+                "build_password_index",
+                source,
+                f"--output={self.path}",
+                "--no-django-common",
+            ],
+            cwd=settings.BASE_DIR,
+            check=True,
+            capture_output=True,
+        )
+
+        validator.validate("first-list")
+        with self.assertRaises(ValidationError):
+            validator.validate("second-list")
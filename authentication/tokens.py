@@ -0,0 +1,48 @@
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.exceptions import ValidationError
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import CustomUser
+
+
+class ResetTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Stateless HMAC password-reset tokens.
+
+    The signature covers the user's id, current password hash, last_login
+    and email plus the issue timestamp, so nothing is stored:
+    - changing the password (i.e. using the token) invalidates it
+    - settings.PASSWORD_RESET_TIMEOUT expires it
+    """
+
+    key_salt = "authentication.tokens.ResetTokenGenerator"
+
+
+password_reset_token = ResetTokenGenerator()
+
+
+def make_password_reset_token(user):
+    """
+    Returns "<uidb64>.<timestamp>-<hmac>" for the reset link.
+    "." never appears in either part, so it is safe to split on.
+    """
+    uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+    return f"{uidb64}.{password_reset_token.make_token(user)}"
+
+
+def get_user_for_reset_token(token):
+    """
+    Returns the user the token was issued for, or None if the token is
+    malformed, expired or already used
+    """
+    try:
+        uidb64, user_token = token.split(".", 1)
+        user_id = force_str(urlsafe_base64_decode(uidb64))
+        user = CustomUser.objects.get(id=user_id)
+    except (ValueError, TypeError, ValidationError, CustomUser.DoesNotExist):
+        return None
+
+    if not password_reset_token.check_token(user, user_token):
+        return None
+    return user
@@ -1,19 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import (
     LoginViewSet,
     LogoutView,
+    MeView,
     PasswordResetConfirmViewSet,
     PasswordResetRequestViewSet,
+    RefreshView,
     RegisterViewSet,
+    ResendOTPViewSet,
     VerifyOTPViewSet,
 )
 
 router = DefaultRouter()
 router.register(r"register", RegisterViewSet, basename="register")
 router.register(r"verify", VerifyOTPViewSet, basename="verify")
+router.register(r"verify/resend", ResendOTPViewSet, basename="verify-resend")
 
 # Using router for consistency
 router.register(r"login", LoginViewSet, basename="login")
@@ -30,6 +33,7 @@ router.register(
 
 urlpatterns = [
     path("", include(router.urls)),
-    path("refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("refresh/", RefreshView.as_view(), name="token_refresh"),
     path("logout/", LogoutView.as_view(), name="logout"),
+    path("me/", MeView.as_view(), name="me"),
 ]
@@ -1,9 +1,20 @@
+import hashlib
+import math
 import secrets
+import threading
+from collections import Counter, namedtuple
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.http import parse_etags
 from datetime import timedelta
 from django.core.mail import send_mail
 
+from . import audit
+from .models import CustomUser
+from .tokens import make_password_reset_token
+
 
 def generate_and_send_otp(user):
     """
@@ -19,8 +30,21 @@ def generate_and_send_otp(user):
     user.otp_created_at = timezone.now()
     user.otp_expiry = user.otp_created_at + \
         timedelta(minutes=10)  # 10 min expiry
-    user.save(update_fields=["otp_code", "otp_created_at", "otp_expiry"])
+    user.otp_sent_at = user.otp_created_at  # starts the resend interval
+    user.save(
+        update_fields=["otp_code", "otp_created_at", "otp_expiry", "otp_sent_at"]
+    )
+
+    if not send_otp_email(user, otp):
+        _release_resend_slot(user)
+        return None
+    return otp  # Return for testing/debugging
 
+
+def send_otp_email(user, otp, minutes=10):
+    """
+    Emails an (already saved) OTP. Returns True on success.
+    """
     # Email content
     subject = "Your Ijaw Voices Verification Code"
 
@@ -73,7 +97,7 @@ def generate_and_send_otp(user):
 
         <div class="otp-box">{otp}</div>
 
-        <p>This code will expire in <strong>10 minutes</strong>.</p>
+        <p>This code will expire in <strong>{minutes} minutes</strong>.</p>
         <p>If you didn't request this code, please ignore this email — your account is safe.</p>
       </div>
 
@@ -89,22 +113,190 @@ def generate_and_send_otp(user):
     </html>
     """
 
+    sent = send_user_email(
+        user,
+        subject=subject,
+        message=f"Your verification code is: {otp}\n\nThis code will expire in {minutes} minutes.",
+        html_message=html_message,
+    )
+    audit.record("otp_sent" if sent else "otp_send_failed", user=user)
+    return sent
+
+
+# OTP resend
+
+
+OTP_RESEND_STATS = Counter()  # per process: sent, reused, coalesced, throttled, failed
+
+ResendResult = namedtuple("ResendResult", "outcome retry_after coalesced")
+
+_resends_in_flight = {}
+_resends_lock = threading.Lock()
+
+
+class _InFlightResend:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def resend_otp(user):
+    """
+    Resends the verification code with as little work as possible:
+    - concurrent calls for the same user in this process share one send
+      (coalesced)
+    - nothing is sent within settings.OTP_RESEND_INTERVAL of the last send
+      (throttled, with retry_after seconds). The interval is claimed with a
+      conditional UPDATE of user.otp_sent_at, so it holds across workers.
+    - a code with at least OTP_REUSE_MIN_REMAINING seconds left is re-sent
+      as is (reused, no DB write); otherwise a new one is generated (sent)
+    Returns a ResendResult.
+    """
+    with _resends_lock:
+        flight = _resends_in_flight.get(user.pk)
+        leader = flight is None
+        if leader:
+            flight = _resends_in_flight[user.pk] = _InFlightResend()
+
+    if not leader:
+        flight.done.wait(timeout=30)
+        _count_resend("coalesced")
+        if flight.result is None:
+            return ResendResult("failed", 0, True)
+        return flight.result._replace(coalesced=True)
+
+    try:
+        flight.result = _resend_otp(user)
+        _count_resend(flight.result.outcome)
+        return flight.result
+    finally:
+        with _resends_lock:
+            del _resends_in_flight[user.pk]
+        flight.done.set()
+
+
+def _count_resend(outcome):
+    with _resends_lock:
+        OTP_RESEND_STATS[outcome] += 1
+
+
+def _resend_otp(user):
+    if not _claim_resend_slot(user):
+        interval = timedelta(seconds=settings.OTP_RESEND_INTERVAL)
+        sent_at = user.otp_sent_at or timezone.now()
+        retry_after = (sent_at + interval - timezone.now()).total_seconds()
+        return ResendResult("throttled", max(1, math.ceil(retry_after)), False)
+
+    remaining = (
+        (user.otp_expiry - timezone.now()).total_seconds()
+        if user.otp_code and user.otp_expiry
+        else 0
+    )
+    if remaining >= settings.OTP_REUSE_MIN_REMAINING:
+        outcome = "reused"
+        sent = send_otp_email(user, user.otp_code, minutes=int(remaining // 60))
+        if not sent:
+            _release_resend_slot(user)
+    else:
+        outcome = "sent"
+        sent = generate_and_send_otp(user) is not None  # releases on failure
+
+    if not sent:
+        return ResendResult("failed", 0, False)
+    return ResendResult(outcome, 0, False)
+
+
+def _claim_resend_slot(user):
+    """
+    Sets otp_sent_at to now unless a send is still within the interval.
+    One UPDATE, so of N workers racing for the same user only one wins.
+    """
+    now = timezone.now()
+    since = now - timedelta(seconds=settings.OTP_RESEND_INTERVAL)
+    claimed = (
+        CustomUser.objects.filter(pk=user.pk)
+        .filter(Q(otp_sent_at__isnull=True) | Q(otp_sent_at__lte=since))
+        .update(otp_sent_at=now)
+    )
+    if claimed:
+        user.otp_sent_at = now
+    return bool(claimed)
+
+
+def _release_resend_slot(user):
+    """After a failed send: let the user retry straight away"""
+    CustomUser.objects.filter(pk=user.pk, otp_sent_at=user.otp_sent_at).update(
+        otp_sent_at=None
+    )
+    user.otp_sent_at = None
+
+
+def otp_resend_stats():
+    """
+    Per-process resend counters, incl. how many sends were suppressed
+    (served at GET /metrics/otp-resend)
+    """
+    with _resends_lock:
+        stats = dict(OTP_RESEND_STATS)
+    stats["suppressed"] = stats.get("coalesced", 0) + stats.get("throttled", 0)
+    return stats
+
+
+def send_user_email(user, subject, message, html_message=None):
+    """
+    Single delivery path for all auth emails (OTP, password reset).
+    Returns True on success, False if the backend raised.
+    """
     try:
         # Use Django's send_mail with Gmail SMTP
         send_mail(
             subject=subject,
-            message=f"Your verification code is: {otp}\n\nThis code will expire in 10 minutes.",
+            message=message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[user.email],
             html_message=html_message,
             fail_silently=False,
         )
         print(f"Email sent successfully to {user.email}")
-        return otp  # Return for testing/debugging
+        return True
     except Exception as e:
         # Log the error for debugging
-        print(f"Failed to send OTP email to {user.email}: {e}")
-        return None
+        print(f"Failed to send email to {user.email}: {e}")
+        return False
+
+
+def send_password_reset_email(user):
+    """
+    Sends a stateless, signed password reset link.
+    Returns the token (for testing/logging) or None on failure.
+    """
+    token = make_password_reset_token(user)
+    reset_url = settings.PASSWORD_RESET_URL.format(token=token)
+    minutes = settings.PASSWORD_RESET_TIMEOUT // 60
+
+    html_message = f"""
+    <!DOCTYPE html>
+    <html>
+      <body style="font-family: Arial, Helvetica, sans-serif; background-color: #f4f4f4;">
+        <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 12px; padding: 30px 24px; text-align: center;">
+          <h1>Ijaw Voices</h1>
+          <p>Hello {user.first_name or 'there'},</p>
+          <p>We received a request to reset your password.</p>
+          <a href="{reset_url}" style="display: inline-block; background: #000; color: white; padding: 12px 32px; text-decoration: none; border-radius: 999px;">Reset password</a>
+          <p>This link will expire in <strong>{minutes} minutes</strong> and can only be used once.</p>
+          <p>If you didn't request this, please ignore this email — your password won't change.</p>
+        </div>
+      </body>
+    </html>
+    """
+
+    sent = send_user_email(
+        user,
+        subject="Reset your Ijaw Voices password",
+        message=f"Reset your password: {reset_url}\n\nThis link will expire in {minutes} minutes.",
+        html_message=html_message,
+    )
+    return token if sent else None
 
 
 def verify_otp(user, code):
@@ -123,3 +315,41 @@ def verify_otp(user, code):
 
     # All good
     return True, "Verification successful"
+
+
+# Current user (GET /auth/me/) caching
+
+
+ME_CACHE_KEY = "auth:me:{}"
+ME_CACHE_TIMEOUT = 60 * 60 * 24
+ME_REPRESENTATION_VERSION = 1  # bump when UserSerializer output changes
+
+
+def user_etag(user):
+    """
+    Strong ETag for the user's profile payload, derived from updated_at.
+    Every save that changes serialized fields must include "updated_at".
+    """
+    raw = f"{ME_REPRESENTATION_VERSION}:{user.pk}:{user.updated_at.isoformat()}"
+    return '"%s"' % hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def etag_matches(header, etag, weak=False):
+    """
+    Does an If-Match / If-None-Match header match `etag`?
+    If-None-Match uses weak comparison (W/ prefixes ignored).
+    """
+    if not header:
+        return False
+    for candidate in parse_etags(header):
+        if candidate == "*":
+            return True
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def invalidate_me_cache(user_id):
+    cache.delete(ME_CACHE_KEY.format(user_id))
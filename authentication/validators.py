@@ -0,0 +1,203 @@
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+from django.contrib.auth.password_validation import CommonPasswordValidator
+from django.core.exceptions import ValidationError
+
+# On-disk layout of the password index:
+#   8-byte header: b"PWIX", version (uint8), record width (uint8), 2 pad bytes
+#   followed by sorted, deduplicated, fixed-width SHA-1 prefixes.
+INDEX_MAGIC = b"PWIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct(">4sBBxx")
+DEFAULT_HASH_WIDTH = 20  # full SHA-1 digest
+
+
+def password_digest(password, width=DEFAULT_HASH_WIDTH):
+    """SHA-1 of the UTF-8 password, truncated to `width` bytes"""
+    return hashlib.sha1(password.encode("utf-8")).digest()[:width]
+
+
+class PasswordHashIndex:
+    """
+    Read-only view over a sorted hash file.
+
+    The file is memory-mapped, so every worker process shares the same
+    page cache instead of holding its own copy of the list.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                raise ValueError(f"{self.path} is not a password index.")
+            magic, version, width = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or not width:
+                raise ValueError(f"{self.path} is not a password index.")
+
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            # Identifies the file this mapping came from (see get_password_index)
+            self.version = (stat.st_ino, stat.st_mtime_ns)
+            self.width = width
+            self.count = (size - INDEX_HEADER.size) // width
+            self._mm = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if self.count
+                else None
+            )
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, digest):
+        """Binary search for a digest (already truncated to `self.width`)"""
+        mm, width, offset = self._mm, self.width, INDEX_HEADER.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * width
+            record = mm[start : start + width]
+            if record < digest:
+                lo = mid + 1
+            elif record > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def contains_password(self, password):
+        return password_digest(password, self.width) in self
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self.count = 0
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_password_index(path):
+    """
+    Returns the shared PasswordHashIndex for `path`, or None if the file
+    has not been built yet. The path is re-stat'ed on every call, so a
+    rebuild (by any process: build_password_index replaces the file) is
+    mapped on the next lookup instead of at the next restart.
+    """
+    path = str(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_ino, stat.st_mtime_ns)
+
+    index = _indexes.get(path)
+    if index is None or index.version != version:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None or index.version != version:
+                # The replaced mapping is unmapped once the last lookup
+                # still using it lets go, rather than closed under it
+                index = _indexes[path] = PasswordHashIndex(path)
+    return index
+
+
+def _write_run(records, directory):
+    """Spills one sorted chunk to an anonymous temp file"""
+    run = tempfile.TemporaryFile(dir=directory)
+    run.writelines(sorted(records))
+    run.seek(0)
+    return run
+
+
+def _read_run(run, width):
+    while True:
+        record = run.read(width)
+        if len(record) < width:
+            return
+        yield record
+
+
+def write_password_index(path, digests, width=DEFAULT_HASH_WIDTH, chunk_size=1_000_000):
+    """
+    Writes an index file from an iterable of digests.
+    Digests are truncated to `width`, sorted and deduplicated. The input is
+    streamed: every `chunk_size` distinct digests are sorted and spilled to a
+    temp file next to `path`, and the runs are merged into the index, so
+    memory stays bounded on multi-million-entry HIBP dumps.
+    Returns the number of records written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    runs, chunk = [], set()
+    written = 0
+    tmp_path = f"{path}.tmp"
+    try:
+        for digest in digests:
+            chunk.add(digest[:width])
+            if len(chunk) >= chunk_size:
+                runs.append(_write_run(chunk, directory))
+                chunk = set()
+
+        merged = heapq.merge(sorted(chunk), *(_read_run(run, width) for run in runs))
+        with open(tmp_path, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, width))
+            previous = None
+            for record in merged:
+                if record != previous:  # the same digest can be in several runs
+                    f.write(record)
+                    written += 1
+                    previous = record
+    finally:
+        for run in runs:
+            run.close()
+    os.replace(tmp_path, path)
+    return written
+
+
+class BreachedPasswordValidator:
+    """
+    Rejects passwords found in the breached/common password index.
+
+    The index is built with `manage.py build_password_index`. Until it
+    exists we fall back to Django's CommonPasswordValidator so the check
+    is never silently skipped.
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path or getattr(
+            settings,
+            "BREACHED_PASSWORDS_INDEX",
+            settings.BASE_DIR / "data" / "breached_passwords.idx",
+        )
+        self._fallback = None
+
+    def validate(self, password, user=None):
+        index = get_password_index(self.index_path)
+
+        if index is None:
+            if self._fallback is None:
+                self._fallback = CommonPasswordValidator()
+            self._fallback.validate(password, user)
+            return
+
+        # Exact match covers HIBP-style hashes, the lowercased form covers
+        # lists that were normalised like Django's common-passwords.txt
+        candidates = {password, password.lower().strip()}
+        if any(index.contains_password(candidate) for candidate in candidates):
+            raise ValidationError(
+                "This password has appeared in a data breach or is too common.",
+                code="password_breached",
+            )
+
+    def get_help_text(self):
+        return "Your password can't be a commonly used or breached password."
@@ -1,22 +1,39 @@
 # authentication/views.py
+from django.core.cache import cache
+from django.http import HttpResponse
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import CreateModelMixin
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.throttling import ScopedRateThrottle  # Explicit for security
 from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from .serializers import (
     LoginSerializer,
+    MeSerializer,
+    ProfileChanged,
     PasswordResetConfirmSerializer,
     PasswordResetRequestSerializer,
     RegisterSerializer,
+    ResendOTPSerializer,
     VerifyOTPSerializer,
     UserSerializer,
 )
+from . import audit, warmup
+from .admission import AdmissionControlMixin, admission_stats
 from .models import CustomUser
+from .utils import (
+    ME_CACHE_KEY,
+    ME_CACHE_TIMEOUT,
+    etag_matches,
+    otp_resend_stats,
+    user_etag,
+)
 
 
 class RegisterViewSet(CreateModelMixin, GenericViewSet):
@@ -26,15 +43,19 @@ class RegisterViewSet(CreateModelMixin, GenericViewSet):
     """
 
     queryset = CustomUser.objects.none()  # We override get_queryset anyway
-    serializer_class = RegisterSerializer
+    serializer_class = RegisterSerializer  # hashes inside the "hashing" pool
     permission_classes = [AllowAny]
     throttle_classes = [ScopedRateThrottle]  # Secure with scope
     throttle_scope = "register"  # Applies '5/hour' limit
+    # exists check, INSERT, outbox INSERT, OTP UPDATE, and one more UPDATE
+    # freeing the resend interval when the email fails
+    query_budget = 5
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
+        audit.record("register", request, user=user)
 
         # Response matches your spec
         return Response(
@@ -58,6 +79,7 @@ class VerifyOTPViewSet(GenericViewSet):
     permission_classes = [AllowAny]
     throttle_classes = [ScopedRateThrottle]  # Secure with scope
     throttle_scope = "verify_otp"  # Applies '10/minute' limit
+    query_budget = 3  # SELECT user, one UPDATE, outbox INSERT
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -66,6 +88,7 @@ class VerifyOTPViewSet(GenericViewSet):
         result = serializer.save()
 
         user = result["user"]
+        audit.record("verify_succeeded", request, user=user)
         user_data = UserSerializer(user).data
 
         return Response(
@@ -80,6 +103,56 @@ class VerifyOTPViewSet(GenericViewSet):
         )
 
 
+class ResendOTPViewSet(GenericViewSet):
+    """
+    POST /auth/verify/resend/
+    Re-sends the verification code (reusing a still-valid one). Concurrent
+    requests for a user collapse into one email; sends closer together
+    than OTP_RESEND_INTERVAL get 429 + Retry-After.
+    """
+
+    queryset = CustomUser.objects.none()
+    serializer_class = ResendOTPSerializer
+    permission_classes = [AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "resend_otp"
+    # SELECT user, UPDATE claiming the send, and a second UPDATE only when
+    # a new code is needed
+    query_budget = 3
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = serializer.save()
+        audit.record(
+            "otp_resend",
+            request,
+            user=serializer.validated_data["user"],
+            outcome=result.outcome,
+            coalesced=result.coalesced,
+        )
+
+        if result.outcome == "throttled":
+            return Response(
+                {
+                    "success": False,
+                    "message": f"Please wait {result.retry_after} seconds before requesting a new code.",
+                    "retryAfter": result.retry_after,
+                },
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(result.retry_after)},
+            )
+
+        return Response(
+            {
+                "success": True,
+                "message": "A verification code has been sent to your email.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 # Login
 
 
@@ -89,9 +162,10 @@ class LoginViewSet(GenericViewSet):
     Returns access + refresh tokens for verified users
     """
 
-    serializer_class = LoginSerializer
+    serializer_class = LoginSerializer  # checks inside the "hashing" pool
     permission_classes = [AllowAny]
     throttle_scope = "login"  # you can add this to throttling later
+    query_budget = 1  # SELECT user
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -99,6 +173,7 @@ class LoginViewSet(GenericViewSet):
 
         user = serializer.validated_data["user"]
         refresh = RefreshToken.for_user(user)
+        audit.record("login", request, user=user)
 
         return Response(
             {
@@ -111,16 +186,32 @@ class LoginViewSet(GenericViewSet):
         )
 
 
+# Token refresh
+
+
+class RefreshView(AdmissionControlMixin, TokenRefreshView):
+    """
+    POST /auth/refresh/
+    simplejwt's refresh, with its own capacity so it keeps working while
+    login/register are shedding load
+    """
+
+    admission_pool = "tokens"
+    query_budget = 0  # signature check only (no token_blacklist app)
+
+
 # Logout (blacklist current refresh token)
 
 
-class LogoutView(APIView):
+class LogoutView(AdmissionControlMixin, APIView):
     """
     POST /auth/logout/
     Blacklists the current refresh token (requires refresh token in body)
     """
 
+    admission_pool = "tokens"
     permission_classes = [AllowAny]
+    query_budget = 2  # blacklist lookup + INSERT when token_blacklist is installed
 
     def post(self, request):
         try:
@@ -131,30 +222,119 @@ class LogoutView(APIView):
             token = RefreshToken(refresh_token)
             token.blacklist()  # Requires BLACKLIST_AFTER_ROTATION = True
 
+            audit.record(
+                "logout", request, user_id=token.get(jwt_settings.USER_ID_CLAIM)
+            )
             return Response({"success": True, "message": "Logged out successfully"})
         except Exception:
+            audit.record("logout_failed", request)
             return Response(
                 {"success": False, "message": "Invalid or already blacklisted token"},
                 status=400,
             )
 
 
+# Current user
+
+
+class MeView(APIView):
+    """
+    GET /auth/me/
+    Current user's profile. Strong ETag from updated_at; If-None-Match → 304
+    without serializing. The rendered body is cached per user.
+
+    PATCH /auth/me/
+    Partial update that writes only changed fields. If-Match → 412 when the
+    profile changed since the client last read it (or while we wrote);
+    without it the fields are applied to the primary's current row.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = MeSerializer
+    # JWT user load; PATCH adds the UPDATE, and without If-Match a re-read
+    # on the primary when the user came from a replica
+    query_budget = {"get": 1, "patch": 3}
+
+    def get(self, request):
+        user = request.user
+        etag = user_etag(user)
+
+        if etag_matches(request.headers.get("If-None-Match"), etag, weak=True):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            return self._with_cache_headers(response, etag)
+
+        # Entries are keyed by ETag too, so a stale entry from a worker that
+        # missed the invalidation is never served
+        key = ME_CACHE_KEY.format(user.pk)
+        cached = cache.get(key)
+        if cached and cached[0] == etag:
+            body = cached[1]
+        else:
+            body = JSONRenderer().render(
+                {"success": True, "user": MeSerializer(user).data}
+            )
+            cache.set(key, (etag, body), ME_CACHE_TIMEOUT)
+
+        response = HttpResponse(body, content_type="application/json")
+        return self._with_cache_headers(response, etag)
+
+    def patch(self, request):
+        user = request.user
+
+        if_match = request.headers.get("If-Match")
+        if if_match and not etag_matches(if_match, user_etag(user)):
+            return self._precondition_failed()
+
+        serializer = MeSerializer(
+            user,
+            data=request.data,
+            partial=True,
+            context={"precondition": bool(if_match)},
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            user = serializer.save()
+        except ProfileChanged:
+            return self._precondition_failed()
+
+        response = Response({"success": True, "user": serializer.data})
+        return self._with_cache_headers(response, user_etag(user))
+
+    def _precondition_failed(self):
+        return Response(
+            {
+                "success": False,
+                "message": "Profile was changed elsewhere. Please reload and try again.",
+            },
+            status=status.HTTP_412_PRECONDITION_FAILED,
+        )
+
+    def _with_cache_headers(self, response, etag):
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
 # Password Reset – Request & Confirm
 
 
 class PasswordResetRequestViewSet(CreateModelMixin, GenericViewSet):
+    """
+    POST /auth/password/reset/request/
+    Emails a signed, time-limited reset link
+    """
+
     serializer_class = PasswordResetRequestSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [ScopedRateThrottle]
     throttle_scope = "password_reset_request"
+    query_budget = 1  # SELECT user
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-
-        # In real app: generate token + send email
-        # For MVP: just simulate
-        email = serializer.validated_data["email"]
-        # Here you would normally: send_reset_email(user, token)
+        user = serializer.save()
+        audit.record("password_reset_requested", request, user=user)
 
         return Response(
             {
@@ -166,18 +346,101 @@ class PasswordResetRequestViewSet(CreateModelMixin, GenericViewSet):
 
 
 class PasswordResetConfirmViewSet(CreateModelMixin, GenericViewSet):
+    """
+    POST /auth/password/reset/confirm/
+    Checks the reset token → sets the new password (token is then spent)
+    """
+
     serializer_class = PasswordResetConfirmSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "password_reset_confirm"
+    query_budget = 2  # SELECT user, UPDATE password
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-
-        # In real app: validate token + set password
-        # For MVP: we skip real token check
-        # You would normally do: user = get_user_from_token(token)
-        # user.set_password(new_password); user.save()
+        user = serializer.save()
+        audit.record("password_reset_completed", request, user=user)
 
         return Response(
             {"success": True, "message": "Password has been reset successfully."}
         )
+
+
+# Load balancer probes
+
+
+class HealthView(APIView):
+    """
+    GET /healthz
+    Liveness: the process is up and serving. Never touches the database.
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+    query_budget = 0
+
+    def get(self, request):
+        return Response({"status": "ok"})
+
+
+class ReadinessView(APIView):
+    """
+    GET /readyz
+    Readiness: this worker finished its warm-up and every database answers.
+    503 until then, so load balancers only route to warm workers.
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+
+    def get(self, request):
+        if warmup.is_warm():
+            state = warmup.state()
+            try:
+                warmup.ping_databases()
+            except Exception as e:
+                state["errors"]["database"] = f"{type(e).__name__}: {e}"
+        else:
+            # Retries a warm-up that failed (e.g. DB down at boot); its
+            # first step pings every database
+            state = warmup.warm_up()
+        ready = state["warm"] and not state["errors"]
+
+        return Response(
+            {"status": "ready" if ready else "unavailable", **state},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+class AdmissionMetricsView(APIView):
+    """
+    GET /metrics/admission
+    This worker's admission pools: active, queue depth and shed counts.
+    Staff only.
+    """
+
+    permission_classes = [IsAdminUser]
+    throttle_classes = []
+    query_budget = 1  # JWT user
+
+    def get(self, request):
+        return Response(admission_stats())
+
+
+class OTPResendMetricsView(APIView):
+    """
+    GET /metrics/otp-resend
+    This worker's OTP resend outcomes, incl. suppressed (coalesced +
+    throttled) sends. Staff only.
+    """
+
+    permission_classes = [IsAdminUser]
+    throttle_classes = []
+    query_budget = 1  # JWT user
+
+    def get(self, request):
+        return Response(otp_resend_stats())
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .sharding import get_user_shards
+
+logger = logging.getLogger(__name__)
+
+# Outcome of the last warm-up in this process: step timings (ms) and errors
+_state = {"pid": None, "warm": False, "steps": {}, "errors": {}}
+_lock = threading.Lock()
+
+
+def database_aliases():
+    """Every database a request can touch: primary, replicas and user shards"""
+    aliases = ["default", *getattr(settings, "DATABASE_REPLICAS", []), *get_user_shards()]
+    return list(dict.fromkeys(aliases))
+
+
+def ping_databases():
+    """SELECT 1 on every database; raises if one is unreachable"""
+    for alias in database_aliases():
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+def _warm_database():
+    # Checks every database answers (and loads the backend modules)
+    ping_databases()
+
+
+def _warm_hashers():
+    from django.contrib.auth.hashers import check_password, get_hashers, make_password
+
+    # Loads argon2/bcrypt bindings for every configured hasher up front
+    for hasher in get_hashers():
+        load = getattr(hasher, "_load_library", None)
+        if load is not None:
+            try:
+                load()
+            except ValueError:
+                pass
+    # One real hash + verify with the default hasher
+    check_password("warm-up", make_password("warm-up"))
+
+
+def _warm_urls():
+    from django.urls import get_resolver, reverse
+
+    get_resolver().url_patterns
+    reverse("schema")
+    reverse("me")
+
+
+def _warm_serializers():
+    from django.urls import get_resolver
+
+    # Instantiating a DRF serializer and touching .fields builds (and caches
+    # on the class) its declared/model fields
+    seen = set()
+    for view_class in _view_classes(get_resolver().url_patterns):
+        serializer_class = getattr(view_class, "serializer_class", None)
+        if serializer_class is not None and serializer_class not in seen:
+            seen.add(serializer_class)
+            serializer_class().fields
+
+
+def _view_classes(patterns):
+    for pattern in patterns:
+        if hasattr(pattern, "url_patterns"):
+            yield from _view_classes(pattern.url_patterns)
+        else:
+            view_class = getattr(pattern.callback, "cls", None)
+            if view_class is not None:
+                yield view_class
+
+
+def _warm_drf():
+    from rest_framework.settings import api_settings
+
+    # api_settings imports its dotted-path settings lazily on first access
+    for name in (
+        "DEFAULT_AUTHENTICATION_CLASSES",
+        "DEFAULT_PERMISSION_CLASSES",
+        "DEFAULT_RENDERER_CLASSES",
+        "DEFAULT_PARSER_CLASSES",
+        "DEFAULT_THROTTLE_CLASSES",
+        "DEFAULT_CONTENT_NEGOTIATION_CLASS",
+        "DEFAULT_SCHEMA_CLASS",
+        "EXCEPTION_HANDLER",
+    ):
+        getattr(api_settings, name)
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    jwt_settings.AUTH_TOKEN_CLASSES
+
+
+def _warm_spectacular():
+    import drf_spectacular.generators  # noqa: F401
+    import drf_spectacular.openapi  # noqa: F401
+
+
+STEPS = [
+    ("database", _warm_database),
+    ("hashers", _warm_hashers),
+    ("urls", _warm_urls),
+    ("drf", _warm_drf),
+    ("serializers", _warm_serializers),
+    ("spectacular", _warm_spectacular),
+]
+
+
+def warm_up():
+    """
+    Pays the first-request costs of this worker up front: DB round trips,
+    hasher libraries plus one dummy check_password, URL resolvers, DRF
+    settings and serializer fields, and the drf-spectacular imports.
+
+    Runs once per process (main/wsgi.py and main/asgi.py call it after the
+    application is loaded); a forked worker warms itself again. The
+    database connections it opens are kept for the first requests, and only
+    closed if this process forks (see close_connections). A failing step is
+    recorded and leaves the worker not ready until a later call (e.g. from
+    /readyz) succeeds.
+    """
+    with _lock:
+        if is_warm():
+            return state()
+
+        steps, errors = {}, {}
+        for name, step in STEPS:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                errors[name] = f"{type(e).__name__}: {e}"
+                logger.exception("Warm-up step %s failed", name)
+            else:
+                steps[name] = round((time.perf_counter() - started) * 1000, 1)
+
+        _state.update(pid=os.getpid(), warm=not errors, steps=steps, errors=errors)
+        _close_connections_before_fork()
+        return state()
+
+
+_fork_hook_registered = False
+
+
+def _close_connections_before_fork():
+    global _fork_hook_registered
+    if not _fork_hook_registered and hasattr(os, "register_at_fork"):
+        os.register_at_fork(before=close_connections)
+        _fork_hook_registered = True
+
+
+def close_connections():
+    """
+    Runs in a process about to fork. Under a preloading server (gunicorn
+    --preload) warm_up() ran in the master, and forked workers would share
+    its database sockets; closing them first leaves each worker to open its
+    own on its first query (kept for CONN_MAX_AGE). Without a fork the
+    warmed connections stay open. Connections inside a transaction are left
+    alone.
+    """
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def is_warm():
+    return _state["warm"] and _state["pid"] == os.getpid()
+
+
+def state():
+    return {
+        "warm": is_warm(),
+        "steps": dict(_state["steps"]),
+        "errors": dict(_state["errors"]),
+    }
+
+
+def reset_warm_up():
+    """Forget this process' warm-up (tests)"""
+    with _lock:
+        _state.update(pid=None, warm=False, steps={}, errors={})
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
 application = get_asgi_application()
+
+# Once per worker process, before it takes traffic (see /readyz)
+from authentication.warmup import warm_up  # noqa: E402
+
+warm_up()
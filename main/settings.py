@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
+import json
 import os
 
 load_dotenv()  # Load environment variables from .env file
@@ -59,6 +60,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "main.staticfiles.PrecompressedStaticMiddleware",
+    "authentication.query_budget.QueryBudgetMiddleware",
+    "authentication.db_routers.ReplicaStickinessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -92,6 +96,11 @@ REST_FRAMEWORK = {
         "verify_otp": "10/minute",
         # 10 login per IP per minute (anti-brute-force)
         "login": "10/minute",
+        # OTP resends per IP (per-user spacing is OTP_RESEND_INTERVAL)
+        "resend_otp": "10/hour",
+        # Reset emails per IP, and token submissions per IP
+        "password_reset_request": "5/hour",
+        "password_reset_confirm": "10/minute",
     },
 }
 
@@ -131,13 +140,59 @@ WSGI_APPLICATION = "main.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are kept per worker thread (and opened by the warm-up in
+# authentication/warmup.py) instead of reconnecting on every request
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Optional read replicas, e.g. DATABASE_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3
+# Reads are routed to them, writes (and reads right after a write) to "default".
+DATABASE_REPLICAS = []
+for i, replica_name in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1
+):
+    DATABASES[f"replica{i}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": replica_name,
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{i}")
+
+# Optional user sharding, e.g. USER_SHARDS=/srv/users1.sqlite3,/srv/users2.sqlite3
+# "default" is always shard 0. Run `migrate --database <alias>` on every shard
+# and `rebalance_user_shards` whenever the list changes.
+USER_SHARDS = []
+for i, shard_name in enumerate(
+    filter(None, os.getenv("USER_SHARDS", "").split(",")), start=1
+):
+    DATABASES[f"users{i}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": shard_name,
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+    }
+    USER_SHARDS.append(f"users{i}")
+if USER_SHARDS:
+    USER_SHARDS.insert(0, "default")
+
+DATABASE_ROUTERS = [
+    "authentication.sharding.UserShardRouter",
+    "authentication.db_routers.PrimaryReplicaRouter",
+]
+
+# How long a client that just wrote keeps reading from the primary
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -148,15 +203,20 @@ AUTH_PASSWORD_VALIDATORS = [
     },
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
+        "OPTIONS": {"min_length": 6},  # same as the serializers
     },
     {
-        "NAME": "django.contrib.auth.password_validation.CommonPasswordValidator",
+        # mmap-backed replacement for CommonPasswordValidator
+        "NAME": "authentication.validators.BreachedPasswordValidator",
     },
     {
         "NAME": "django.contrib.auth.password_validation.NumericPasswordValidator",
     },
 ]
 
+# Sorted SHA-1 index built with `manage.py build_password_index`
+BREACHED_PASSWORDS_INDEX = BASE_DIR / "data" / "breached_passwords.idx"
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -182,6 +242,17 @@ STATICFILES_DIRS = [
 # Where collectstatic will collect all static files for production
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic writes content-hashed names plus .br/.gz variants and
+# optimises images; PrecompressedStaticMiddleware serves them
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "main.staticfiles.PrecompressedManifestStaticFilesStorage",
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -200,6 +271,80 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")  # Your App Password
 # Default from email (used when sending OTP)
 DEFAULT_FROM_EMAIL = os.getenv("EMAIL_HOST_USER", "noreply@ijawvoices.com")
 
+# OTP resend: minimum gap between sends per user, and how long a code must
+# still be valid to be re-sent as is instead of generating a new one
+OTP_RESEND_INTERVAL = 60  # seconds
+OTP_REUSE_MIN_REMAINING = 2 * 60  # seconds
+
+# purge_unverified_users deletes unverified signups older than this
+UNVERIFIED_USER_RETENTION = timedelta(days=7)
+
+# Password reset links (stateless signed tokens, see authentication/tokens.py)
+PASSWORD_RESET_TIMEOUT = 60 * 60  # 1 hour
+PASSWORD_RESET_URL = os.getenv(
+    "PASSWORD_RESET_URL", "http://localhost:4200/reset-password?token={token}"
+)
+
+# Per-view query budgets (`query_budget` on views, see authentication/query_budget.py)
+# Overruns are logged; the test suite switches MODE to "raise"
+QUERY_BUDGET = {
+    "MODE": os.getenv("QUERY_BUDGET_MODE", "log"),
+    "REPEAT_THRESHOLD": 3,
+}
+
+# Auth audit trail (authentication/audit.py): buffered per process, written
+# in batches to append-only JSONL segments or the AuditEvent table
+AUDIT_LOG = {
+    "SINK": os.getenv("AUDIT_LOG_SINK", "jsonl"),  # "jsonl" or "database"
+    "DIRECTORY": BASE_DIR / "logs" / "audit",
+    "SEGMENT_MAX_BYTES": 64 * 1024 * 1024,
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL": 2.0,
+    "MAX_PENDING": 10_000,
+    "BLOCK_TIMEOUT": 0.05,
+}
+
+# Admission control (authentication/admission.py): per-process capacity for
+# password hashing (login/register) and, separately, refresh/logout. Beyond
+# CONCURRENCY + QUEUE (or after TIMEOUT seconds queued) requests get a 503
+# with Retry-After. CONCURRENCY None = one per available CPU; with several
+# workers per host set HASHING_CONCURRENCY to about CPUs / workers.
+ADMISSION_CONTROL = {
+    "hashing": {
+        "CONCURRENCY": int(os.getenv("HASHING_CONCURRENCY", "0")) or None,
+        "QUEUE": None,  # 2x CONCURRENCY
+        "TIMEOUT": 2.0,
+    },
+    "tokens": {"CONCURRENCY": 16, "QUEUE": 64, "TIMEOUT": 1.0},
+}
+
+# User lifecycle webhooks (authentication/events.py): events are written to an
+# outbox with the change itself and delivered by `manage.py dispatch_events`.
+# WEBHOOK_ENDPOINTS is JSON, e.g.
+# {"progress": {"URL": "https://progress.internal/hooks/users", "SECRET": "...",
+#               "EVENTS": ["user.verified"], "MAX_CONCURRENCY": 2}}
+WEBHOOKS = {
+    "ENDPOINTS": json.loads(os.getenv("WEBHOOK_ENDPOINTS", "{}")),
+    "BATCH_SIZE": 100,
+    "MAX_CONCURRENCY": 2,
+    "TIMEOUT": 5.0,
+    "MAX_ATTEMPTS": 10,
+    "RETRY_BASE": 30,
+    "RETRY_MAX": 6 * 60 * 60,
+}
+
+# Fault injection (authentication/faults.py) for load and chaos runs: added
+# latency and errors in the email backend, SQL execution and password hashers.
+# `manage.py fault_scenarios` turns it on against a throwaway database; only
+# set FAULT_INJECTION_ENABLED on a staging deployment.
+FAULT_INJECTION = {
+    "ENABLED": os.getenv("FAULT_INJECTION_ENABLED", "") == "1",
+    "SEED": None,
+    "EMAIL": {},  # e.g. {"LATENCY": {"DISTRIBUTION": "fixed", "MS": 10000}}
+    "DB": {},  # e.g. {"MATCH": "^INSERT", "ERROR_RATE": 0.05}
+    "HASHER": {},
+}
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Ijaw Voices API",
     "DESCRIPTION": "Ijaw Voices API V1",
@@ -0,0 +1,19 @@
+"""
+Settings for the test suite; manage.py uses them for `manage.py test`.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+# Extra SQLite databases the routing tests use, each with its own test
+# database: a replica that never receives the primary's writes (so any read
+# routed to it is visible) and two more user shards next to "default".
+DATABASES = {
+    **DATABASES,
+    **{
+        alias: {**DATABASES["default"], "NAME": BASE_DIR / f"{alias}.sqlite3"}
+        for alias in ("replica_test", "shard_test_1", "shard_test_2")
+    },
+}
+
+TEST_RUNNER = "main.test_runner.TestRunner"
@@ -0,0 +1,184 @@
+import gzip
+import io
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage,
+    staticfiles_storage,
+)
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Optional build-time dependencies: without them we still hash and gzip
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(javascript|json|xml|manifest\+json|wasm)|image/svg\+xml)"
+)
+# Only formats Pillow can re-encode losslessly; JPEGs are copied as they are
+OPTIMISABLE_IMAGES = {".png": "PNG"}
+MIN_COMPRESS_SIZE = 256
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]  # preferred first
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=0, must-revalidate"
+
+
+def optimise_image(name, data):
+    """
+    Lossless re-encode of PNGs, keeping the colour profile and EXIF;
+    returns the smaller of the two
+    """
+    image_format = OPTIMISABLE_IMAGES.get(os.path.splitext(name)[1].lower())
+    if Image is None or image_format is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, "is_animated", False):
+                return data  # saving would keep only the first frame
+            options = {"optimize": True}
+            for key in ("icc_profile", "exif"):
+                if image.info.get(key):
+                    options[key] = image.info[key]
+            out = io.BytesIO()
+            image.save(out, format=image_format, **options)
+    except (OSError, ValueError):
+        return data
+    optimised = out.getvalue()
+    return optimised if len(optimised) < len(data) else data
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic storage that
+    - losslessly optimises PNGs as they are copied in
+    - writes content-hashed names (ManifestStaticFilesStorage)
+    - writes .br/.gz siblings for text assets, served by PrecompressedStaticMiddleware
+    """
+
+    def save(self, name, content, max_length=None):
+        if Image is not None and os.path.splitext(name)[1].lower() in OPTIMISABLE_IMAGES:
+            content = ContentFile(optimise_image(name, content.read()))
+        return super().save(name, content, max_length=max_length)
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if not dry_run and not isinstance(processed, Exception):
+                for path in {name, hashed_name}:
+                    if path:
+                        self.compress(path)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        content_type, _ = mimetypes.guess_type(name)
+        if not content_type or not COMPRESSIBLE_TYPES.match(content_type):
+            return
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+
+        variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+
+        for suffix, compressed in variants.items():
+            # Not worth an extra round of negotiation for < 5% savings
+            if len(compressed) < len(data) * 0.95:
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serves files from STATIC_ROOT, picking the best precompressed variant
+    the client accepts. Content-hashed names get far-future immutable
+    caching; everything else must revalidate.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        self.root = str(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+
+    def __call__(self, request):
+        if (
+            self.root
+            and request.method in ("GET", "HEAD")
+            and request.path_info.startswith(self.prefix)
+        ):
+            response = self.serve(request, request.path_info[len(self.prefix) :])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except ValueError:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        if not was_modified_since(
+            request.headers.get("If-Modified-Since"), stat.st_mtime
+        ):
+            return HttpResponseNotModified(headers={"Vary": "Accept-Encoding"})
+
+        content_type, _ = mimetypes.guess_type(name)
+        encoding, served_path = None, path
+        accepted = accepted_encodings(request)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                encoding, served_path = coding, path + suffix
+                break
+
+        response = FileResponse(
+            open(served_path, "rb"),
+            content_type=content_type or "application/octet-stream",
+        )
+        # FileResponse names the open file in Content-Disposition; assets
+        # are displayed inline, and under their URL's name
+        response.headers.pop("Content-Disposition", None)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Last-Modified"] = http_date(stat.st_mtime)
+        response.headers["Cache-Control"] = (
+            IMMUTABLE_CACHE if name in self.hashed_names else REVALIDATE_CACHE
+        )
+        return response
+
+    @cached_property
+    def hashed_names(self):
+        """Content-hashed names from the collectstatic manifest"""
+        return set(getattr(staticfiles_storage, "hashed_files", {}).values())
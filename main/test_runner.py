@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from authentication.query_budget import enforce_query_budgets
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner plus settings that hold for the whole run and are undone
+    afterwards: every request must stay within its view's query budget, and
+    audit segments go to a temporary directory (removed at the end) and are
+    flushed synchronously.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.audit_directory = tempfile.mkdtemp(prefix="audit-test-")
+        self.overrides = [
+            enforce_query_budgets(),
+            override_settings(
+                AUDIT_LOG={"DIRECTORY": self.audit_directory, "FLUSH_INTERVAL": None}
+            ),
+        ]
+        for override in self.overrides:
+            override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        for override in reversed(self.overrides):
+            override.disable()
+        shutil.rmtree(self.audit_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,5 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path
+from authentication.views import (
+    AdmissionMetricsView,
+    HealthView,
+    OTPResendMetricsView,
+    ReadinessView,
+)
 from drf_spectacular.views import (
     SpectacularAPIView,  # raw OpenAPI schema (JSON/YAML)
     SpectacularSwaggerView,  # beautiful interactive UI
@@ -9,6 +15,15 @@ from drf_spectacular.views import (
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/", include("authentication.urls")),
+    # Load balancer liveness / readiness probes
+    path("healthz", HealthView.as_view(), name="healthz"),
+    path("readyz", ReadinessView.as_view(), name="readyz"),
+    path(
+        "metrics/admission", AdmissionMetricsView.as_view(), name="admission-metrics"
+    ),
+    path(
+        "metrics/otp-resend", OTPResendMetricsView.as_view(), name="otp-resend-metrics"
+    ),
     # Swagger / OpenAPI endpoints
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path(
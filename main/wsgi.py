@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
 application = get_wsgi_application()
+
+# Once per worker process, before it takes traffic (see /readyz)
+from authentication.warmup import warm_up  # noqa: E402
+
+warm_up()